@@ -2,27 +2,54 @@ import dash
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.graph_objs as go
-from dash import Input, Output, dcc, html, State, dash_table
+from dash import Input, Output, dcc, html, State, dash_table, ALL, ClientsideFunction
 from utils import *
-import plotly.express as px
+from jobs import JobCoordinator, JobRejected, document_key, document_label
+from corpus import CoSignatureGraph
 import gunicorn
 from dash.exceptions import PreventUpdate
 from dash.long_callback import DiskcacheLongCallbackManager
+from flask import Response, abort, jsonify, request, send_from_directory
+from whitenoise import WhiteNoise
 import diskcache
 import time
+import os
+import tempfile
+import uuid
 from datetime import timedelta
 
+# Keep downloaded pdfs in memory instead of writing them to the pdf folder (for ephemeral deployments)
+PDF_IN_MEMORY = os.environ.get('PDF_IN_MEMORY', 'true').lower() == 'true'
+# Minimum estimated similarity of two near-duplicate amendments
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', 0.8))
+# Folder of the MEP picture thumbnails and how long browsers may cache them (file names are content hashes)
+THUMBNAIL_FOLDER = os.environ.get('THUMBNAIL_FOLDER', 'thumbnails')
+THUMBNAIL_MAX_AGE = 365 * 86400
+# Number of MEPs in the bar chart, the others are aggregated in a single bar
+BAR_TOP_N = int(os.environ.get('BAR_TOP_N', 50))
+# Formats of the server side export and their mimetype
+EXPORT_FORMATS = {'csv': 'text/csv',
+                  'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                  'parquet': 'application/vnd.apache.parquet'}
 
 cache = diskcache.Cache('./cache')
 lcm = DiskcacheLongCallbackManager(cache)
+coordinator = JobCoordinator(cache,
+                             max_running=int(os.environ.get('MAX_RUNNING_JOBS', 1)),
+                             max_queued=int(os.environ.get('MAX_QUEUED_JOBS', 5)),
+                             result_ttl=int(os.environ.get('JOB_RESULT_TTL', 86400)))
+cosignatures = CoSignatureGraph(cache)
 
 app = dash.Dash(__name__,
                 external_stylesheets=[dbc.themes.SIMPLEX,
                                       'https://fonts.googleapis.com/css2?family=Libre+Baskerville&display=swap'],
-                long_callback_manager=lcm)
+                long_callback_manager=lcm,
+                suppress_callback_exceptions=True)
 
 server = app.server
-# server.wsgi_app = WhiteNoise(server.wsgi_app, root='static/')
+# Thumbnails already on disk at startup are served by whitenoise, the ones created later by the thumbnail route
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+server.wsgi_app = WhiteNoise(server.wsgi_app, root=THUMBNAIL_FOLDER, prefix='thumbnails/', max_age=THUMBNAIL_MAX_AGE)
 
 app.css.config.serve_locally = True
 
@@ -48,9 +75,40 @@ app.layout = dbc.Container(
                        'margin-right': '5%'}),
             dbc.Button('Go!', id='button', className="me-2", n_clicks=0, style={'width': '10%',
                                                                                 'margin-left': '5%'})], align="center"),
+        html.P(id='job_status', style={'display': 'none'}),
 
+        html.Div(id='output'),
 
-        html.Div(id='output')
+        html.H5("Who worked with whom across all the documents analysed?", style={'margin-left': '4%',
+                                                                                  'margin-top': '4%'}),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='corpus_committees', multi=True, placeholder='Filter by Committee')),
+            dbc.Col(dcc.DatePickerRange(id='corpus_dates', clearable=True)),
+            dbc.Col([html.Span("Minimum co-signed amendments", style={'font-family': 'sans-serif'}),
+                     dcc.Slider(id='corpus_min_weight', min=1, max=10, step=1, value=1)]),
+            dbc.Col(dbc.Button('Refresh', id='corpus_refresh', n_clicks=0), width=1),
+        ], style={'width': '95%',
+                  'margin': 'auto',
+                  'margin-top': '1%'}),
+        html.P(id='corpus_info', style={'margin-left': '4%', 'margin-top': '1%'}),
+        dbc.Row([
+            cyto.Cytoscape(
+                id='corpus_graph',
+                layout={'name': 'cose'},
+                elements=[],
+                stylesheet=[{'selector': 'node',
+                             'style': {'label': 'data(label)',
+                                       'shape': 'circle',
+                                       'width': 'data(size)',
+                                       'height': 'data(size)',
+                                       'background-color': 'data(color)'}},
+                            {'selector': 'edge',
+                             'style': {'width': 'mapData(weight, 1, 20, 1, 8)'}}],
+                style={'width': '100%', 'height': '450px'}
+            ),
+        ], style={'width': '95%',
+                  'margin': 'auto',
+                  'margin-bottom': '4%'}),
     ],
     fluid=True,
 )
@@ -61,54 +119,106 @@ app.layout = dbc.Container(
 
 
 
+def process_document(url: str) -> dict:
+    """
+    Runs the heavy part of the analysis: download, parsing, scraping and topic modelling
+    :param url: a url like https://www.europarl.europa.eu/doceo/document/ITRE-AM-746920_EN.pdf
+    :return: dict containing the processed document (see normalize_amendments), the nmf model, its feature names,
+    the article index (see build_article_index), the document name and a version identifying this result
+    """
+    start = time.time()
+    if PDF_IN_MEMORY:
+        stream = fetch_pdf(url)
+    else:
+        stream = None
+        save_pdf(url)
+    end = time.time()
+    print('save_pdf: ', timedelta(seconds=end - start))
+
+    start = time.time()
+    df = get_scanned_pdf(stream=stream, cache=cache)
+    end = time.time()
+    print('get_scanned_pdf: ', timedelta(seconds=end - start))
+
+    start = time.time()
+    df = clean_scanned(df)
+    end = time.time()
+    print('clean_scanned: ', timedelta(seconds=end - start))
+
+    start = time.time()
+    df = join_dfs(df)
+    df = df.rename(columns={'meps': 'MEP', 'am_no': 'Amendment Number',
+                            'article': 'Article', 'justification': 'Justification'})
+    end = time.time()
+    print('join_dfs: ', timedelta(seconds=end - start))
+
+    start = time.time()
+    df_total = add_scraped_info(df=df, cache=cache, thumbnail_folder=THUMBNAIL_FOLDER)
+    end = time.time()
+    print('add_scraped_info: ', timedelta(seconds=end - start))
+
+    # Add topics
+    start = time.time()
+    df_total, nmf, feature_names = add_topics(df_total)
+    end = time.time()
+    print('add_topics: ', timedelta(seconds=end - start))
+
+    # Near-duplicate amendments, within the document and across the documents processed before
+    start = time.time()
+    df_total = add_duplicates(df_total, threshold=DUPLICATE_THRESHOLD, cache=cache,
+                              doc_key=document_key(url), label=document_label(url))
+    end = time.time()
+    print('add_duplicates: ', timedelta(seconds=end - start))
+
+    # Counts of every level of the article hierarchy, read by the polar chart and the data store
+    article_index = build_article_index(df_total)
+
+    amendments, meps, links = normalize_amendments(df_total)
+
+    # Add the document to the co-signature graph of all the processed documents
+    start = time.time()
+    cosignatures.add_document(document_key(url), meps, links, label=document_label(url),
+                              date=get_pdf_date(stream=stream))
+    end = time.time()
+    print('cosignatures.add_document: ', timedelta(seconds=end - start))
+
+    return {'amendments': amendments, 'meps': meps, 'links': links,
+            'nmf': nmf, 'feature_names': feature_names, 'article_index': article_index,
+            'label': document_label(url), 'version': uuid.uuid4().hex}
+
+
 @app.long_callback(
     Output('output', 'children'),
     Input('button', 'n_clicks'),
     State('url_input', 'value'),
+    progress=[Output('job_status', 'children')],
+    running=[(Output('job_status', 'style'), {'margin-left': '5%', 'margin-top': '1%'}, {'display': 'none'})],
     prevent_initial_call=True
 )
-def return_divs(n_clicks, url):
+def return_divs(set_progress, n_clicks, url):
 
     if n_clicks > 0:
-            start = time.time()
-            save_pdf(url)
-            end = time.time()
-            print('save_pdf: ', timedelta(seconds=end - start))
-
-            start = time.time()
-            df = get_scanned_pdf()
-            end = time.time()
-            print('get_scanned_pdf: ', timedelta(seconds=end - start))
-
-            start = time.time()
-            df = clean_scanned(df)
-            end = time.time()
-            print('clean_scanned: ', timedelta(seconds=end - start))
-
-            start = time.time()
-            df = join_dfs(df)
-            df = df.rename(columns={'meps': 'MEP', 'am_no': 'Amendment Number',
-                                    'article': 'Article', 'justification': 'Justification'})
-            end = time.time()
-            print('join_dfs: ', timedelta(seconds=end - start))
+            def on_wait(position):
+                if position is None:
+                    set_progress(("This document is already being analysed, waiting for the result...",))
+                else:
+                    set_progress((f"The server is busy, your position in the queue is {position}...",))
 
-            start = time.time()
-            df_total = add_scraped_info(df=df)
-            end = time.time()
-            print('add_scraped_info: ', timedelta(seconds=end - start))
+            def analyse():
+                set_progress(("Analysing the document...",))
+                return process_document(url)
 
-            # Add topics
-            start = time.time()
-            df_total, nmf, feature_names = add_topics(df_total)
-            end = time.time()
-            print('add_topics: ', timedelta(seconds=end - start))
+            try:
+                doc_key = document_key(url)
+                document = coordinator.run(doc_key, analyse, on_wait=on_wait)
+            except JobRejected:
+                return dbc.Alert("Too many documents are waiting to be analysed, please try again later.",
+                                 color='warning', style={'margin-left': '5%', 'margin-top': '3%', 'width': '90%'})
+            df_total = denormalize_amendments(document['amendments'], document['meps'], document['links'])
+            nmf, feature_names = document['nmf'], document['feature_names']
 
             # ---------------------------------------------------------------------------------------------------------------
-            # Data table
-            start = time.time()
-            scraped_df = df_total.copy()
-            scraped_df = scraped_df.drop(['picture_link'], axis=1)
-            dataframe = scraped_df.to_dict('records')
+            # Data table, its rows are filled in the browser from the data store (see assets/crossfilter.js)
             cols = [{"name": "MEP", "id": "MEP"},
                     {"name": "Amendment #", "id": "Amendment #"},
                     {"name": "Article", "id": "Article"},
@@ -119,9 +229,9 @@ def return_divs(n_clicks, url):
                     {"name": "European Group", "id": "European Group"},
                     {"name": "Country", "id": "Country"},
                     {"name": "Topic", "id": "Topic"},
+                    {"name": "Duplicates", "id": "Duplicates"},
+                    {"name": "Similar in other documents", "id": "Similar in other documents"},
                     ]
-            end = time.time()
-            print('scraped_df.to_dict: ', timedelta(seconds=end - start))
             # ---------------------------------------------------------------------------------------------------------------
             # Network graph
             start = time.time()
@@ -132,7 +242,10 @@ def return_divs(n_clicks, url):
                                'background-color': '#d9230f'
                            }},
                           {'selector': 'edge',
-                           'style': {'width': 'data(weight)'}}]
+                           'style': {'width': 'data(weight)'}},
+                          {'selector': '.duplicate',
+                           'style': {'line-style': 'dashed',
+                                     'line-color': '#139418'}}]
 
             elements = get_network_elements_v2(df_total)
             end = time.time()
@@ -161,11 +274,9 @@ def return_divs(n_clicks, url):
             # ---------------------------------------------------------------------------------------------------------------
             # Polar chart
             start = time.time()
-            df_polar = df_total.groupby(['European Group',
-                                         'Article']).size().reset_index(name='Number of Amendments').copy()
-            if len(df_polar) >= 20:
-                df_polar = df_polar[df_polar['Article'].isin(
-                    df_polar.groupby('Article')['Number of Amendments'].sum().nlargest(20).index)]
+            # The chart starts from the top level of the article index and can be drilled down by clicking on it (see
+            # assets/crossfilter.js)
+            article_index = document['article_index']
 
             color_discrete_map = {"Group of the European People's Party (Christian Democrats)": '#003f86',
                                   'European Conservatives and Reformists Group': '#0285fd',
@@ -177,74 +288,59 @@ def return_divs(n_clicks, url):
                                   'Non-attached Members': '#cbcbcb',
                                   'Identity and Democracy Group': '#879c8f'}
 
-            fig_polar = px.bar_polar(df_polar, r="Number of Amendments", theta="Article", color="European Group",
-                                     color_discrete_map=color_discrete_map, template='plotly_white',
-                                     title='Top 20 most amended articles')
-            fig_polar.update_layout(
-                font_family="sans-serif")
-            fig_polar.update_layout({
-                'plot_bgcolor': '#fcfcfc',
-                'paper_bgcolor': '#fcfcfc',
-            })
-            fig_polar.update_layout(showlegend=False)
+            # Figures are serialized once per result and shared by repeated views and users. The key holds the version
+            # of the result, so that a reprocessed document never shows the figures of the previous one
+            fig_key = f"figure:{doc_key}:{document['version']}"
+            fig_polar = cached_figure(f'{fig_key}:polar:20',
+                                      lambda: get_polar_figure(get_article_counts(article_index, n=20),
+                                                               color_discrete_map),
+                                      cache=cache, expire=coordinator.result_ttl)
             end = time.time()
             print('polar: ', timedelta(seconds=end - start))
 
             # ---------------------------------------------------------------------------------------------------------------
             # Barchart
             start = time.time()
-            df_counts = df_total[['MEP']]
-            df_counts = df_counts.value_counts().rename_axis('MEP').reset_index(name='Number of amendments')
-            df_bar = df_total.merge(df_counts, how='right', on='MEP')
-            df_bar = df_bar.drop_duplicates(subset=['MEP', 'Number of amendments', 'European Group'])
+            fig_bar = cached_figure(f'{fig_key}:bar:{BAR_TOP_N}',
+                                    lambda: get_bar_figure(df_total, color_discrete_map, top_n=BAR_TOP_N),
+                                    cache=cache, expire=coordinator.result_ttl)
             end = time.time()
-            print('add_scraped_info_no_diff: ', timedelta(seconds=end - start))
+            print('fig_bar: ', timedelta(seconds=end - start))
 
+            # ---------------------------------------------------------------------------------------------------------------
+            # Data used for cross-filtering in the browser (assets/crossfilter.js)
             start = time.time()
-
-            fig_bar = px.bar(df_bar, x='Number of amendments', y='MEP', template='plotly_white',
-                             title='Who signed the most amendments?',
-                             labels={
-                                 "MEP": ""},
-                             color='European Group',
-                             color_discrete_map=color_discrete_map)
-            fig_bar.update_layout(font_family="sans-serif")
-            fig_bar.update_layout(showlegend=False)
-            fig_bar.update_layout(yaxis={'categoryorder': 'total ascending'})
-            fig_bar.update_layout({
-                'plot_bgcolor': '#fcfcfc',
-                'paper_bgcolor': '#fcfcfc',
-            })
+            data_store = get_data_store(document['amendments'], document['meps'], document['links'],
+                                        color_discrete_map, article_index, bar_top_n=BAR_TOP_N)
+            filters = []
+            for col, placeholder in [('European Group', 'Filter by European Group'), ('Country', 'Filter by Country'),
+                                     ('Article', 'Filter by Article'), ('Topic', 'Filter by Topic')]:
+                filters.append(dbc.Col(dcc.Dropdown(id=f'filter_{col.lower().replace(" ", "_")}',
+                                                    options=sorted(df_total[col].dropna().unique()),
+                                                    multi=True, placeholder=placeholder)))
             end = time.time()
-            print('fig_bar: ', timedelta(seconds=end - start))
+            print('data_store: ', timedelta(seconds=end - start))
 
             # ---------------------------------------------------------------------------------------------------------------
             # Cards
-            #headers = {
-            #    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.106 Safari/537.36'}
             start = time.time()
             cards = []
-            df_total['id'] = df_total['MEP'].map(hash)
-            for mep in df_total['MEP'].unique():
+            for _, row in document['meps'].iterrows():
+                mep = row['MEP']
+                img_url = row.get('picture_link')
+                thumbnail = row.get('thumbnail')
+                party = row.get('European Group')
+                country = row.get('Country')
 
-                # get picture link
-                img_url = df_total[df_total['MEP'] == mep]['picture_link'].iloc[0]
-                party = df_total[df_total['MEP'] == mep]['European Group'].iloc[0]
-                country = df_total[df_total['MEP'] == mep]['Country'].iloc[0]
-                id_mep = df_total[df_total['MEP'] == mep]['id'].iloc[0]
+                # Prefer the local thumbnail (see cache_thumbnails) to the full size picture
+                if pd.isna(thumbnail) == False:
+                    img_url = f'/thumbnails/{thumbnail}'
 
                 if pd.isna(img_url) == False:
-                    #response = requests.get(img_url, stream=True, headers=headers)
-                    #response = requests.get(img_url, stream=True)
-
-                    # save picture
-                    #with open(f'assets\\{id_mep}.png', 'bw') as img_file:
-                        #img_file.write(response.content)
-
                     card = dbc.Card(
-                        [
+                        id={'type': 'mep_card', 'index': mep},
+                        children=[
                             dbc.CardImg(
-                                #src=f'assets\\{id_mep}.png', alt='image',
                                 src=img_url, alt='image',
                                 top=True),
                             dbc.CardBody(
@@ -270,7 +366,8 @@ def return_divs(n_clicks, url):
 
                 else:
                     card = dbc.Card(
-                        [
+                        id={'type': 'mep_card', 'index': mep},
+                        children=[
                             dbc.CardBody(
                                 [
                                     html.H4(f"{mep}", className="card-title"),
@@ -298,10 +395,14 @@ def return_divs(n_clicks, url):
             # Dynamic layout
             start = time.time()
             dynamic_layout = [
+                dcc.Store(id='data_store', data=data_store),
+                dcc.Store(id='article_path', data=[]),
+                dbc.Row(filters, style={'width': '95%',
+                                        'margin': 'auto',
+                                        'margin-top': '3%'}),
                 dbc.Row([
                     dash_table.DataTable(
                         id='table',
-                        data=dataframe,
                         columns=cols,
                         row_selectable="multi",
                         sort_action="native",
@@ -332,6 +433,15 @@ def return_divs(n_clicks, url):
                 ], style={'width': '95%',
                           'margin': 'auto',
                           'margin-top': '3%'}),
+                dbc.Row([
+                    dbc.Col([
+                        html.Span("Download the full document: ", style={'font-family': 'sans-serif'}),
+                        *[dbc.Button(fmt.upper(), href=f'/export/{doc_key}.{fmt}', external_link=True,
+                                     color='link', size='sm') for fmt in EXPORT_FORMATS]
+                    ])
+                ], style={'width': '95%',
+                          'margin': 'auto',
+                          'margin-top': '1%'}),
                 html.H5("Who worked with whom?", style={'margin-left': '4%',
                                                         'margin-top': '4%'}),
                 dbc.Row([
@@ -349,7 +459,9 @@ def return_divs(n_clicks, url):
                            'margin-top': '3%'}
                 ),
                 dbc.Row([
-                    dbc.Col([dcc.Graph(id='sunburst', figure=fig_polar)], style={'width': '40%', 'height': '450px'}),
+                    dbc.Col([dcc.Graph(id='sunburst', figure=fig_polar),
+                             dbc.Button('Up one level', id='article_up', color='link', size='sm', n_clicks=0)],
+                            style={'width': '40%', 'height': '450px'}),
                     dbc.Col([dcc.Graph(id='barchart', figure=fig_bar)], style={'width': '60%', 'height': '450px'}),
                 ]),
                 html.H5("Who are the MEPs involved?", style={'margin-left': '4%',
@@ -371,5 +483,143 @@ def return_divs(n_clicks, url):
             return dynamic_layout
 
 
+# Corpus network ---------------------------------------------------------------------------------------------------------
+
+COMMUNITY_COLORS = ['#d9230f', '#003f86', '#fea607', '#27c201', '#0285fd', '#4c0203', '#879c8f', '#cbcbcb']
+
+
+@app.callback(
+    Output('corpus_graph', 'elements'),
+    Output('corpus_committees', 'options'),
+    Output('corpus_info', 'children'),
+    Input('corpus_refresh', 'n_clicks'),
+    Input('corpus_committees', 'value'),
+    Input('corpus_dates', 'start_date'),
+    Input('corpus_dates', 'end_date'),
+    Input('corpus_min_weight', 'value'),
+)
+def update_corpus_graph(n_clicks, committees, start_date, end_date, min_weight):
+    subgraph = cosignatures.subgraph(date_from=start_date[:10] if start_date else None,
+                                     date_to=end_date[:10] if end_date else None,
+                                     committees=committees,
+                                     min_weight=min_weight or 1)
+
+    # Node size by centrality and color by community in the whole corpus
+    nodes = [el['data'] for el in subgraph['elements'] if 'label' in el['data']]
+    max_centrality = max((node['centrality'] for node in nodes), default=1)
+    elements = []
+    for el in subgraph['elements']:
+        data = el['data']
+        if 'label' in data:
+            data = {**data,
+                    'size': 15 + 45 * data['centrality'] / max_centrality,
+                    'color': COMMUNITY_COLORS[data['community'] % len(COMMUNITY_COLORS)]}
+        elements.append({'data': data})
+
+    info = f"{len(nodes)} MEPs from {subgraph['documents']} documents"
+    return elements, cosignatures.committees(), info
+
+
+@server.route('/api/network')
+def network_api():
+    """
+    Co-signature graph of the processed documents.
+    Query parameters: from and to (YYYY-MM-DD), committee (repeatable), min_weight and top (number of MEPs)
+    """
+    subgraph = cosignatures.subgraph(date_from=request.args.get('from'),
+                                     date_to=request.args.get('to'),
+                                     committees=request.args.getlist('committee'),
+                                     min_weight=request.args.get('min_weight', 1, type=int),
+                                     top_n=request.args.get('top', 150, type=int))
+    return jsonify(subgraph)
+
+
+# Thumbnails -------------------------------------------------------------------------------------------------------------
+
+@server.route('/thumbnails/<name>')
+def serve_thumbnail(name):
+    """
+    Serves the MEP picture thumbnails created after startup, see cache_thumbnails
+    """
+    return send_from_directory(THUMBNAIL_FOLDER, name, max_age=THUMBNAIL_MAX_AGE)
+
+
+# Export -----------------------------------------------------------------------------------------------------------------
+
+@server.route('/export/<doc_key>.<fmt>')
+def export(doc_key, fmt):
+    """
+    Streams a processed document from the cache.
+    Query parameters: table ('denormalized', 'amendments', 'meps' or 'links') and columns (comma separated)
+    """
+    document = coordinator.result(doc_key)
+    if fmt not in EXPORT_FORMATS or document is None:
+        abort(404)
+    table = request.args.get('table', 'denormalized')
+    if table not in ('denormalized', 'amendments', 'meps', 'links'):
+        abort(400)
+    columns = request.args.get('columns')
+    columns = columns.split(',') if columns else None
+
+    chunks = iter_export_chunks(document['amendments'], document['meps'], document['links'],
+                                table=table, columns=columns)
+    path = None
+    if fmt == 'csv':
+        body = stream_csv(chunks)
+    else:
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            if fmt == 'xlsx':
+                write_xlsx(chunks, path)
+            else:
+                write_parquet(chunks, path)
+        except Exception:
+            os.remove(path)
+            raise
+        body = stream_file(path)
+
+    filename = f"{document['label']}_{table}.{fmt}"
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    if path is not None:
+        # Called when the response is closed, also if the client disconnects before the file is read
+        response.call_on_close(lambda: os.remove(path))
+    return response
+
+
+# Redraws the table, charts, network and cards in the browser when the filters change. It also runs when a document
+# is displayed, to fill the table from the data store instead of sending its rows a second time
+app.clientside_callback(
+    ClientsideFunction(namespace='crossfilter', function_name='filter'),
+    Output('table', 'data'),
+    Output('sunburst', 'figure'),
+    Output('barchart', 'figure'),
+    Output('network_graph', 'elements'),
+    Output({'type': 'mep_card', 'index': ALL}, 'style'),
+    Input('filter_european_group', 'value'),
+    Input('filter_country', 'value'),
+    Input('filter_article', 'value'),
+    Input('filter_topic', 'value'),
+    Input('article_path', 'data'),
+    State('data_store', 'data'),
+    State('sunburst', 'figure'),
+    State('barchart', 'figure'),
+    State({'type': 'mep_card', 'index': ALL}, 'id'),
+    State({'type': 'mep_card', 'index': ALL}, 'style')
+)
+
+# Drills the polar chart down to the clicked article, or up one level
+app.clientside_callback(
+    ClientsideFunction(namespace='crossfilter', function_name='drill'),
+    Output('article_path', 'data'),
+    Input('sunburst', 'clickData'),
+    Input('article_up', 'n_clicks'),
+    State('article_path', 'data'),
+    State('data_store', 'data'),
+    prevent_initial_call=True
+)
+
+
 if __name__ == '__main__':
     app.run_server()
@@ -0,0 +1,194 @@
+// Clientside cross-filtering of a processed document. The data comes from the dcc.Store built by get_data_store
+// in utils.py: amendments and meps are stored once, links holds the position of every MEP-amendment pair.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    crossfilter: {
+        filter: function (groups, countries, articles, topics, path, store, polar, bar, cardIds, cardStyles) {
+            const am = store.amendments;
+            const mep = store.meps;
+            const links = store.links;
+            const selected = (values, value) => !values || values.length === 0 || values.includes(value);
+            const inPath = a => path.every((name, depth) => store.article_paths[a][depth] === name);
+
+            // Rows (MEP-amendment pairs) passing the filters
+            const rows = [];
+            for (let i = 0; i < links.amendment.length; i++) {
+                const a = links.amendment[i];
+                const m = links.mep[i];
+                if (selected(groups, mep['European Group'][m]) && selected(countries, mep['Country'][m]) &&
+                    selected(articles, am['Article'][a]) && selected(topics, am['Topic'][a]) && inPath(a)) {
+                    rows.push(i);
+                }
+            }
+
+            // Data table
+            const data = rows.map(i => {
+                const row = {};
+                for (const col in am) {
+                    row[col] = am[col][links.amendment[i]];
+                }
+                for (const col in mep) {
+                    row[col] = mep[col][links.mep[i]];
+                }
+                return row;
+            });
+
+            // When the document is displayed, only the table has to be filled: the figures come from the server
+            const triggered = dash_clientside.callback_context.triggered.map(t => t.prop_id);
+            if (triggered.every(id => id === '.')) {
+                const noUpdate = dash_clientside.no_update;
+                return [data, noUpdate, noUpdate, noUpdate, cardIds.map(() => noUpdate)];
+            }
+
+            // Polar chart: top 20 most amended sub-provisions of the current article path by European Group
+            const depth = path.length;
+            const polarCounts = {};
+            const articleTotals = {};
+            const addPolar = (group, article, count) => {
+                polarCounts[group] = polarCounts[group] || {};
+                polarCounts[group][article] = (polarCounts[group][article] || 0) + count;
+                articleTotals[article] = (articleTotals[article] || 0) + count;
+            };
+            if (![countries, articles, topics].some(values => values && values.length)) {
+                // Counts precomputed in the article index
+                const node = path.reduce((node, name) => node.children[name], store.article_index);
+                Object.values(node.children).forEach(child => Object.entries(child.groups).forEach(
+                    ([group, count]) => {
+                        if (selected(groups, group)) {
+                            addPolar(group, child.name, count);
+                        }
+                    }));
+            } else {
+                rows.forEach(i => {
+                    const group = mep['European Group'][links.mep[i]];
+                    const articlePath = store.article_paths[links.amendment[i]];
+                    if (group !== null && articlePath.length > depth) {
+                        addPolar(group, articlePath[depth], 1);
+                    }
+                });
+            }
+            const topArticles = new Set(Object.entries(articleTotals)
+                .sort((x, y) => y[1] - x[1]).slice(0, 20).map(x => x[0]));
+            const polarData = Object.entries(polarCounts).map(([group, counts]) => {
+                const theta = Object.keys(counts).filter(article => topArticles.has(article));
+                return {type: 'barpolar', name: group, theta: theta, r: theta.map(article => counts[article]),
+                        marker: {color: store.colors[group]}};
+            });
+            const polarTitle = depth ? 'Top 20 most amended provisions of ' + path.join(' – ') :
+                'Top 20 most amended articles';
+
+            // Bar chart: number of amendments signed by every MEP
+            const mepCounts = {};
+            rows.forEach(i => {
+                mepCounts[links.mep[i]] = (mepCounts[links.mep[i]] || 0) + 1;
+            });
+            // Only the top MEPs get their own bar, the others are aggregated as in get_bar_figure
+            const sortedMeps = Object.entries(mepCounts).sort((x, y) => y[1] - x[1]);
+            const topMeps = sortedMeps.slice(0, store.bar.top_n);
+            const otherMeps = sortedMeps.slice(store.bar.top_n);
+            const barByGroup = {};
+            topMeps.forEach(([m, count]) => {
+                const group = mep['European Group'][m];
+                barByGroup[group] = barByGroup[group] || {x: [], y: []};
+                barByGroup[group].x.push(count);
+                barByGroup[group].y.push(mep['MEP'][m]);
+            });
+            const barData = Object.entries(barByGroup).map(([group, xy]) => (
+                {type: 'bar', orientation: 'h', name: group, x: xy.x, y: xy.y,
+                 marker: {color: store.colors[group]}}));
+            const categories = topMeps.map(([m, count]) => mep['MEP'][m]).reverse();
+            if (otherMeps.length) {
+                const label = 'Others (' + otherMeps.length + ' MEPs)';
+                barData.push({type: 'bar', orientation: 'h', name: 'Others', y: [label],
+                              x: [otherMeps.reduce((total, [m, count]) => total + count, 0)],
+                              marker: {color: store.bar.others_color}});
+                categories.unshift(label);
+            }
+
+            // Network: co-signatures and MEPs who tabled duplicate amendments
+            const mepsByAmendment = {};
+            rows.forEach(i => {
+                const a = links.amendment[i];
+                mepsByAmendment[a] = mepsByAmendment[a] || new Set();
+                mepsByAmendment[a].add(links.mep[i]);
+            });
+            const nodes = new Set();
+            const edges = {};
+            const addEdge = (m1, m2, classes) => {
+                const key = m1 + '-' + m2 + '-' + classes;
+                edges[key] = edges[key] || {classes: classes, data: {source: m1, target: m2, weight: 0}};
+                edges[key].data.weight += 1;
+                nodes.add(m1);
+                nodes.add(m2);
+            };
+            Object.values(mepsByAmendment).forEach(meps => meps.forEach(m1 => meps.forEach(m2 => {
+                if (m1 !== m2) {
+                    addEdge(m1, m2, '');
+                }
+            })));
+            if (am['Duplicate Cluster']) {
+                const clusters = {};
+                Object.keys(mepsByAmendment).forEach(a => {
+                    const cluster = am['Duplicate Cluster'][a];
+                    if (cluster !== null && cluster >= 0) {
+                        clusters[cluster] = (clusters[cluster] || []).concat([a]);
+                    }
+                });
+                Object.values(clusters).forEach(members => members.forEach(a1 => members.forEach(a2 => {
+                    if (a1 !== a2) {
+                        mepsByAmendment[a1].forEach(m1 => mepsByAmendment[a2].forEach(m2 => {
+                            if (m1 !== m2) {
+                                addEdge(m1, m2, 'duplicate');
+                            }
+                        }));
+                    }
+                })));
+            }
+            const elements = Array.from(nodes).map(m => (
+                {classes: 'nopic', data: {id: String(m), label: mep['MEP'][m]}}));
+            Object.values(edges).forEach(edge => {
+                edge.data.source = String(edge.data.source);
+                edge.data.target = String(edge.data.target);
+                elements.push(edge);
+            });
+
+            // Cards: hide the MEPs without amendments left
+            const visible = new Set(Object.keys(mepCounts).map(m => mep['MEP'][m]));
+            const styles = cardIds.map((id, i) => {
+                const style = Object.assign({}, cardStyles[i]);
+                if (visible.has(id.index)) {
+                    delete style.display;
+                } else {
+                    style.display = 'none';
+                }
+                return style;
+            });
+
+            return [data,
+                    Object.assign({}, polar, {data: polarData,
+                                              layout: Object.assign({}, polar.layout, {title: {text: polarTitle}})}),
+                    Object.assign({}, bar, {data: barData,
+                                            layout: Object.assign({}, bar.layout, {
+                                                yaxis: Object.assign({}, bar.layout.yaxis,
+                                                                     {categoryorder: 'array', categoryarray: categories})
+                                            })}),
+                    elements,
+                    styles];
+        },
+
+        drill: function (clickData, upClicks, path, store) {
+            const triggered = dash_clientside.callback_context.triggered.map(t => t.prop_id);
+            if (triggered.includes('article_up.n_clicks')) {
+                return path.slice(0, -1);
+            }
+            if (clickData && clickData.points.length) {
+                const node = path.reduce((node, name) => node.children[name], store.article_index);
+                const child = node.children[clickData.points[0].theta];
+                if (child && Object.keys(child.children).length) {
+                    return path.concat([child.name]);
+                }
+            }
+            return dash_clientside.no_update;
+        }
+    }
+});
@@ -0,0 +1,275 @@
+from __future__ import annotations
+import re
+import numpy as np
+import pandas as pd
+import diskcache
+from scipy import sparse
+
+
+def get_committee(label: str) -> str | None:
+    """
+    Get the committee of a document from its name
+    :param label: document name like ITRE-AM-746920_EN
+    :return: the committee, like ITRE
+    """
+    match = re.match(r'([A-Z]+)-AM', label or '')
+    return match[1] if match else None
+
+
+def cosignature_matrix(links: pd.DataFrame, mep_ids: np.ndarray, n_meps: int) -> sparse.coo_matrix:
+    """
+    Get the number of amendments co-signed by every pair of MEPs of a document
+    :param links: links obtained by normalize_amendments
+    :param mep_ids: global id of every MEP of the document, in the order of the meps table
+    :param n_meps: number of MEPs in the corpus
+    :return: upper triangular sparse matrix of shape (n_meps, n_meps)
+    """
+    n_amendments = int(links['amendment'].max()) + 1 if len(links) else 0
+    incidence = sparse.csr_matrix((np.ones(len(links)), (links['amendment'], mep_ids[links['mep']])),
+                                  shape=(n_amendments, n_meps))
+    incidence.data[:] = 1  # An MEP signing the same amendment twice counts once
+    return sparse.triu(incidence.T @ incidence, k=1).tocoo()
+
+
+def label_propagation(adjacency: sparse.csr_matrix, labels: np.ndarray, frontier, max_iter: int = 20) -> np.ndarray:
+    """
+    Updates communities by weighted label propagation, starting from the nodes in frontier: a node takes the label
+    with the largest weight among its neighbours, and its neighbours are visited again if its label changes
+    :param adjacency: symmetric weighted adjacency matrix
+    :param labels: current community of every node
+    :param frontier: nodes whose neighbourhood changed
+    :param max_iter: maximum number of rounds
+    :return labels: the updated communities
+    """
+    labels = labels.copy()
+    frontier = set(int(node) for node in frontier)
+    for _ in range(max_iter):
+        if not frontier:
+            break
+        next_frontier = set()
+        for node in sorted(frontier):
+            start, end = adjacency.indptr[node], adjacency.indptr[node + 1]
+            if start == end:
+                continue
+            neighbours = adjacency.indices[start:end]
+            totals = {}
+            for label, weight in zip(labels[neighbours], adjacency.data[start:end]):
+                totals[label] = totals.get(label, 0) + weight
+            best = max(totals, key=lambda label: (totals[label], -label))
+            if best != labels[node]:
+                labels[node] = best
+                next_frontier.update(neighbours.tolist())
+        frontier = next_frontier
+    return labels
+
+
+def weighted_pagerank(adjacency: sparse.csr_matrix,
+                      start: np.ndarray,
+                      damping: float = 0.85,
+                      tol: float = 1e-8,
+                      max_iter: int = 100) -> np.ndarray:
+    """
+    Weighted PageRank by power iteration. Starting from the previous scores, few iterations are needed after a
+    document is added
+    :param adjacency: symmetric weighted adjacency matrix
+    :param start: initial scores
+    :param damping: damping factor
+    :param tol: stop when the scores change less than this
+    :param max_iter: maximum number of iterations
+    :return: the score of every node, summing to 1
+    """
+    n = adjacency.shape[0]
+    if n == 0:
+        return start
+    strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    transition = sparse.diags(np.divide(1, strength, out=np.zeros(n), where=strength > 0)) @ adjacency
+    dangling = strength == 0
+    x = start / start.sum()
+    for _ in range(max_iter):
+        new = damping * (transition.T @ x + x[dangling].sum() / n) + (1 - damping) / n
+        converged = np.abs(new - x).sum() < tol
+        x = new
+        if converged:
+            break
+    return x
+
+
+class CoSignatureGraph:
+    """
+    MEP co-signature graph across all processed documents, stored in a diskcache.Cache. Every document keeps its own
+    sparse adjacency so that the graph can be aggregated over time windows and committees, while the total graph,
+    its communities and centralities are updated incrementally when a document is added.
+    """
+
+    def __init__(self, cache: diskcache.Cache):
+        """
+        :param cache: the cache in which the graph is stored
+        """
+        self.cache = cache
+        self._subgraphs = {}
+
+    def documents(self) -> dict:
+        """
+        Get the documents in the corpus
+        :return: dict of document key: dict with label, committee and date
+        """
+        return self.cache.get('corpus:documents', {})
+
+    def committees(self) -> list:
+        """
+        Get the committees of the documents in the corpus
+        :return: sorted list of committees
+        """
+        return sorted({doc['committee'] for doc in self.documents().values() if doc['committee']})
+
+    def add_document(self,
+                     doc_key: str,
+                     meps: pd.DataFrame,
+                     links: pd.DataFrame,
+                     label: str | None = None,
+                     date: str | None = None):
+        """
+        Adds a document to the corpus, or replaces it if it was added before
+        :param doc_key: key identifying the document
+        :param meps: meps obtained by normalize_amendments
+        :param links: links obtained by normalize_amendments
+        :param label: document name like ITRE-AM-746920_EN
+        :param date: date of the document as YYYY-MM-DD
+        """
+        with self.cache.transact():
+            # Global MEP ids
+            names = self.cache.get('corpus:meps', [])
+            index = {name: i for i, name in enumerate(names)}
+            info = self.cache.get('corpus:mep_info', {})
+            for row in meps.to_dict('records'):
+                if row['MEP'] not in index:
+                    index[row['MEP']] = len(names)
+                    names.append(row['MEP'])
+                info.setdefault(row['MEP'], {}).update({col: row[col] for col in ('European Group', 'Country')
+                                                        if pd.notna(row.get(col))})
+            self.cache.set('corpus:meps', names)
+            self.cache.set('corpus:mep_info', info)
+            n = len(names)
+
+            # Adjacency of the document and change of the total adjacency
+            mep_ids = np.array([index[name] for name in meps['MEP']], dtype=int)
+            adjacency = cosignature_matrix(links, mep_ids, n)
+            delta = adjacency.tocsr()
+            previous = self.cache.get(f'corpus:adjacency:{doc_key}')
+            if previous is not None:
+                delta = delta - self._to_matrix(previous, n)
+            self.cache.set(f'corpus:adjacency:{doc_key}', (adjacency.row, adjacency.col, adjacency.data))
+
+            total = self.cache.get('corpus:total')
+            total = delta if total is None else self._to_matrix(total, n) + delta
+            total = total.tocoo()
+            total.eliminate_zeros()
+            self.cache.set('corpus:total', (total.row, total.col, total.data))
+
+            documents = self.documents()
+            documents[doc_key] = {'label': label, 'committee': get_committee(label), 'date': date}
+            self.cache.set('corpus:documents', documents)
+
+            self._update_analytics(total, delta.tocoo(), n)
+            self.cache.set('corpus:version', self.cache.get('corpus:version', 0) + 1)
+
+    def _update_analytics(self, total: sparse.coo_matrix, delta: sparse.coo_matrix, n: int):
+        """
+        Updates communities, PageRank and strength of the total graph, starting from the stored ones
+        :param total: upper triangular total adjacency
+        :param delta: upper triangular change of the total adjacency
+        :param n: number of MEPs in the corpus
+        """
+        state = self.cache.get('corpus:analytics', {'community': np.empty(0, dtype=int),
+                                                    'pagerank': np.empty(0)})
+        n_old = len(state['community'])
+        symmetric = (total + total.T).tocsr()
+
+        # New MEPs start in their own community, only the neighbourhood of the changed edges is revisited
+        community = np.concatenate([state['community'], np.arange(n_old, n)])
+        community = label_propagation(symmetric, community, np.union1d(delta.row, delta.col))
+
+        pagerank = np.concatenate([state['pagerank'], np.full(n - n_old, 1 / max(n, 1))])
+        pagerank = weighted_pagerank(symmetric, pagerank)
+
+        self.cache.set('corpus:analytics', {'community': community,
+                                            'pagerank': pagerank,
+                                            'strength': np.asarray(symmetric.sum(axis=1)).ravel()})
+
+    @staticmethod
+    def _to_matrix(stored: tuple, n: int) -> sparse.csr_matrix:
+        """
+        Get a stored (row, col, data) triplet as a sparse matrix
+        :param stored: the triplet
+        :param n: number of MEPs in the corpus
+        :return: sparse matrix of shape (n, n)
+        """
+        row, col, data = stored
+        return sparse.csr_matrix((data, (row, col)), shape=(n, n))
+
+    def subgraph(self,
+                 date_from: str | None = None,
+                 date_to: str | None = None,
+                 committees: list | None = None,
+                 min_weight: int = 1,
+                 top_n: int = 150) -> dict:
+        """
+        Get the co-signature graph of the documents in a time window and committees
+        :param date_from: first date as YYYY-MM-DD, documents without date are excluded when given
+        :param date_to: last date as YYYY-MM-DD
+        :param committees: committees to keep, all if None or empty
+        :param min_weight: minimum number of co-signed amendments of an edge
+        :param top_n: number of MEPs with the most co-signatures to keep
+        :return: dict with the number of documents and the elements of the network graph. Nodes carry the
+        community and PageRank of the MEP in the whole corpus and its strength in the subgraph
+        """
+        key = (self.cache.get('corpus:version', 0), date_from, date_to, tuple(sorted(committees or [])),
+               min_weight, top_n)
+        if key in self._subgraphs:
+            return self._subgraphs[key]
+
+        documents = self.documents()
+        selected = [doc_key for doc_key, doc in documents.items()
+                    if (not committees or doc['committee'] in committees) and
+                    (not date_from or (doc['date'] or '') >= date_from) and
+                    (not date_to or (doc['date'] or '9999') <= date_to)]
+        names = self.cache.get('corpus:meps', [])
+        n = len(names)
+
+        if len(selected) == len(documents):
+            stored = [self.cache.get('corpus:total', (np.empty(0, int), np.empty(0, int), np.empty(0)))]
+        else:
+            stored = [self.cache.get(f'corpus:adjacency:{doc_key}') for doc_key in selected]
+            stored = [s for s in stored if s is not None]
+        if stored:
+            row, col, data = (np.concatenate(values) for values in zip(*stored))
+        else:
+            row, col, data = np.empty(0, int), np.empty(0, int), np.empty(0)
+        adjacency = sparse.coo_matrix((data, (row, col)), shape=(n, n)).tocsr().tocoo()  # Sums duplicates
+
+        keep = adjacency.data >= min_weight
+        row, col, data = adjacency.row[keep], adjacency.col[keep], adjacency.data[keep]
+        strength = np.bincount(row, weights=data, minlength=n) + np.bincount(col, weights=data, minlength=n)
+        nodes = np.argsort(-strength, kind='stable')[:top_n]
+        nodes = nodes[strength[nodes] > 0]
+        in_nodes = np.zeros(n, dtype=bool)
+        in_nodes[nodes] = True
+        keep = in_nodes[row] & in_nodes[col]
+
+        analytics = self.cache.get('corpus:analytics')
+        info = self.cache.get('corpus:mep_info', {})
+        elements = [{'data': {'id': str(i),
+                              'label': names[i],
+                              'European Group': info.get(names[i], {}).get('European Group'),
+                              'community': int(analytics['community'][i]),
+                              'centrality': float(analytics['pagerank'][i]),
+                              'strength': float(strength[i])}}
+                    for i in nodes]
+        elements += [{'data': {'source': str(r), 'target': str(c), 'weight': float(w)}}
+                     for r, c, w in zip(row[keep], col[keep], data[keep])]
+
+        result = {'documents': len(selected), 'elements': elements}
+        if len(self._subgraphs) > 64:
+            self._subgraphs.clear()
+        self._subgraphs[key] = result
+        return result
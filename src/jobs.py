@@ -0,0 +1,207 @@
+from __future__ import annotations
+import hashlib
+import pathlib
+import threading
+import time
+import uuid
+from typing import Any, Callable
+from urllib.parse import urlsplit, urlunsplit
+import diskcache
+
+
+class JobRejected(Exception):
+    """
+    Raised when a job is submitted while the backlog of queued jobs is full
+    """
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a document url so that the same document is always identified by the same string
+    :param url: a url like https://www.europarl.europa.eu/doceo/document/ITRE-AM-746920_EN.pdf
+    :return: the url with lowercase scheme and host, surrounding whitespace and fragment removed
+    """
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+
+def document_key(url: str) -> str:
+    """
+    Get a short key identifying a document
+    :param url: the document url
+    :return: hash of the normalized url
+    """
+    return hashlib.sha1(normalize_url(url).encode()).hexdigest()[:16]
+
+
+def document_label(url: str) -> str:
+    """
+    Get a readable name for a document
+    :param url: the document url
+    :return: the file name without extension, like ITRE-AM-746920_EN
+    """
+    return pathlib.PurePosixPath(urlsplit(url.strip()).path).stem
+
+
+class JobCoordinator:
+    """
+    Coordinates heavy jobs across the processes running long callbacks. Identical jobs submitted while one is in
+    flight wait for its result instead of starting their own computation, at most max_running jobs run at the same
+    time and at most max_queued jobs wait for a free slot. All state lives in a diskcache.Cache so that it is shared
+    between processes. While a job waits or runs, its process sends heartbeats; a job without heartbeats for longer
+    than the lease is considered dead and its slot is freed.
+    """
+
+    def __init__(self,
+                 cache: diskcache.Cache,
+                 max_running: int = 1,
+                 max_queued: int = 5,
+                 result_ttl: int = 86400,
+                 lease: float = 60,
+                 poll_interval: float = 1):
+        """
+        :param cache: the cache shared with the long callback manager
+        :param max_running: maximum number of jobs running at the same time
+        :param max_queued: maximum number of jobs waiting for a free slot, further jobs are rejected
+        :param result_ttl: seconds a result is kept, so that repeated requests are served from the cache
+        :param lease: seconds without heartbeat after which a job is considered dead and its slot is freed
+        :param poll_interval: seconds between checks while waiting
+        """
+        self.cache = cache
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+    def result(self, key: str) -> Any:
+        """
+        Get the stored result of a job
+        :param key: the job key
+        :return: the result, or None if the job has not run or its result expired
+        """
+        return self.cache.get(f'jobs:result:{key}')
+
+    def run(self, key: str, fn: Callable[[], Any], on_wait: Callable[[int | None], None] | None = None) -> Any:
+        """
+        Runs fn, unless a job with the same key is in flight or has a stored result
+        :param key: the job key, for example document_key(url)
+        :param fn: the heavy computation, its result must be picklable
+        :param on_wait: called while waiting with the position in the queue, or None when waiting for an identical
+        job started by someone else
+        :return: the result of fn
+        """
+        result = self.result(key)
+        if result is not None:
+            return result
+
+        inflight = f'jobs:inflight:{key}'
+        if self.cache.add(inflight, uuid.uuid4().hex, expire=self.lease):
+            held = {}
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(inflight, held, stop), daemon=True)
+            heartbeat.start()
+            try:
+                held['token'] = self._acquire(on_wait)
+                try:
+                    result = fn()
+                finally:
+                    self._release(held.pop('token'))
+                self.cache.set(f'jobs:result:{key}', result, expire=self.result_ttl)
+                return result
+            finally:
+                stop.set()
+                heartbeat.join()
+                self.cache.delete(inflight)
+
+        # Someone else is computing the same job, wait for their result
+        while True:
+            result = self.result(key)
+            if result is not None:
+                return result
+            if inflight not in self.cache:
+                # The other job failed, try again
+                return self.run(key, fn, on_wait)
+            if on_wait:
+                on_wait(None)
+            time.sleep(self.poll_interval)
+
+    def _acquire(self, on_wait: Callable[[int | None], None] | None) -> str:
+        """
+        Enters the queue and waits for a free slot
+        :param on_wait: called with the position in the queue while waiting
+        :return: token identifying the running job
+        """
+        token = uuid.uuid4().hex
+        with self.cache.transact():
+            queue = self._queue()
+            if len(queue) >= self.max_queued:
+                raise JobRejected(f'{len(queue)} jobs are already waiting')
+            queue.append([token, time.time()])
+            self.cache.set('jobs:queue', queue)
+
+        try:
+            while True:
+                with self.cache.transact():
+                    queue = self._queue()
+                    running = self._running()
+                    position = [t for t, _ in queue].index(token)
+                    queue[position][1] = time.time()  # heartbeat
+                    if position == 0 and len(running) < self.max_running:
+                        queue.pop(0)
+                        running[token] = time.time()
+                        self.cache.set('jobs:running', running)
+                        self.cache.set('jobs:queue', queue)
+                        return token
+                    self.cache.set('jobs:queue', queue)
+                if on_wait:
+                    on_wait(position + 1)
+                time.sleep(self.poll_interval)
+        except BaseException:
+            with self.cache.transact():
+                self.cache.set('jobs:queue', [item for item in self._queue() if item[0] != token])
+            raise
+
+    def _heartbeat(self, inflight: str, held: dict, stop: threading.Event):
+        """
+        Keeps the in flight key and the running slot of a job alive until stop is set, however long the job waits
+        in the queue or runs
+        :param inflight: the in flight key of the job
+        :param held: dict holding the token of the job under 'token' while it has a running slot
+        :param stop: event set when the job is over
+        """
+        while not stop.wait(self.lease / 3):
+            self.cache.touch(inflight, expire=self.lease)
+            with self.cache.transact():
+                running = self._running()
+                token = held.get('token')
+                if token in running:
+                    running[token] = time.time()
+                    self.cache.set('jobs:running', running)
+
+    def _release(self, token: str):
+        """
+        Frees the slot of a running job
+        :param token: token returned by _acquire
+        """
+        with self.cache.transact():
+            running = self._running()
+            running.pop(token, None)
+            self.cache.set('jobs:running', running)
+
+    def _queue(self) -> list:
+        """
+        Get the waiting jobs, dropping the ones whose process stopped polling
+        :return: list of [token, last heartbeat]
+        """
+        now = time.time()
+        return [item for item in self.cache.get('jobs:queue', []) if now - item[1] < self.lease]
+
+    def _running(self) -> dict:
+        """
+        Get the running jobs, dropping the ones without heartbeat for longer than the lease
+        :return: dict of token: last heartbeat
+        """
+        now = time.time()
+        return {token: beat for token, beat in self.cache.get('jobs:running', {}).items()
+                if now - beat < self.lease}
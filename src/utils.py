@@ -19,10 +19,45 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from wordcloud import WordCloud
 import base64
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 import matplotlib.pyplot as plt
+import hashlib
+import diskcache
+import itertools
+import functools
+import zlib
+import json
+import plotly.graph_objs as go
+import plotly.io as pio
 
 url = 'https://www.europarl.europa.eu/doceo/document/ITRE-AM-746920_EN.pdf'
 
+# Mersenne prime used by the MinHash hash functions
+MINHASH_PRIME = np.uint64((1 << 61) - 1)
+
+# Columns of the df obtained by add_scraped_info that describe the MEP rather than the amendment
+MEP_COLUMNS = ['European Group', 'Country', 'picture_link', 'thumbnail']
+
+# Levels of the hierarchy of an act recognised in article references
+ARTICLE_LEVELS = ['citation', 'recital', 'title', 'chapter', 'section', 'article', 'annex', 'part', 'paragraph',
+                  'subparagraph', 'point', 'indent']
+
+# Headers of the column of the text being amended
+COLUMN_HEADERS = ['Text proposed by the Commission', 'Motion for a resolution', 'Draft opinion', 'Present text']
+
+# Repeated text is looked for as footer below this fraction of the page height
+FOOTER_BAND = 0.85
+
+# Footer cut on pages without repeated footer text, as a fraction of the page height (750pt on A4)
+DEFAULT_FOOTER = 750 / 842
+
+# Layout part of the plotly_white template, without the defaults of every trace type which are not used
+FIGURE_TEMPLATE = go.layout.Template(layout=pio.templates['plotly_white'].layout)
+
+# Color of the bar aggregating the MEPs outside of the top of the bar chart
+OTHERS_COLOR = '#e5e5e5'
+
 
 def plot_wordcloud(model, feature_names, n_words):
     for topic_idx, topic in enumerate(model.components_):
@@ -113,30 +148,116 @@ def save_pdf(url: str, name: str | None = None):
         urllib.request.urlretrieve(url, "pdfs/download.pdf")
 
 
-def get_scanned_pdf(path: str = "pdfs/download.pdf") -> pd.DataFrame:
+def fetch_pdf(url: str) -> bytes:
     """
-    Obtain a pandas df containing bounding boxes of blocks of text, the original text and additional information
-    from a pdf file
-    :param path: path of the file
-    :return span_df: a pandas dataframe
+    Retrieves pdf from url and keeps it in memory, without writing it to the pdf folder
+    :param url: a url like https://www.europarl.europa.eu/doceo/document/ITRE-AM-746920_EN.pdf
+    :return: the raw bytes of the pdf
     """
-    start = time.time()
-    doc = fitz.open(path)  # Open pdf
-    end = time.time()
-    print('get_scanned_pdf: fitz.open: ', timedelta(seconds=end - start))
+    with urllib.request.urlopen(url) as response:
+        return response.read()
 
-    start = time.time()
-    block_dict = {}
-    page_num = 1
-    for page in doc:  # Iterate all pages in the document
-        file_dict = page.get_text('dict')  # Get the page dictionary
-        block = file_dict['blocks']  # Get the block information
-        block_dict[page_num] = block  # Store in block dictionary
-        page_num += 1  # Increase the page value by 1
-    end = time.time()
-    print('get_scanned_pdf: store blocks: ', timedelta(seconds=end - start))
 
-    start = time.time()
+def get_pdf_date(path: str = "pdfs/download.pdf", stream: bytes | None = None) -> str | None:
+    """
+    Get the creation date of a pdf from its metadata
+    :param path: path of the file, ignored if stream is given
+    :param stream: raw bytes of the pdf as returned by fetch_pdf
+    :return: the date as YYYY-MM-DD, None if the metadata does not contain it
+    """
+    doc = fitz.open(stream=stream, filetype='pdf') if stream is not None else fitz.open(path)
+    date = doc.metadata.get('creationDate') or doc.metadata.get('modDate') or ''
+    match = re.match(r'D:(\d{4})(\d{2})(\d{2})', date)
+    return f'{match[1]}-{match[2]}-{match[3]}' if match else None
+
+
+# Tokens of a pdf content stream: strings (with one level of nested parentheses), hex strings, dictionary
+# delimiters, arrays, names, numbers and operators
+CONTENT_TOKEN = re.compile(rb'\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)|<<|>>|<[0-9A-Fa-f\s]*>|[\[\]]|'
+                           rb'/[^\s/\[\]()<>{}%]*|[^\s/\[\]()<>{}%]+', re.S)
+# First bytes of the operands in a content stream, every other token is an operator
+OPERAND_START = frozenset(b'(<[]/+-.0123456789')
+
+
+def multiply(m: tuple, n: tuple) -> tuple:
+    """
+    Multiplies two pdf transformation matrices given as (a, b, c, d, e, f)
+    :param m: the matrix applied first
+    :param n: the matrix applied second
+    :return: the product
+    """
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + b * c2, a * b2 + b * d2, c * a2 + d * c2, c * b2 + d * d2, e * a2 + f * c2 + e2,
+            e * b2 + f * d2 + f2)
+
+
+def mask_footer_text(page: fitz.Page, band: float = FOOTER_BAND) -> bytes:
+    """
+    Get the content stream of a pdf page without the text shown in the footer band, which holds the document
+    reference, version and page numbers. The position of the text is followed through the graphics state (q, Q, cm)
+    and the text matrix (Tm, Td, TD)
+    :param page: a fitz page
+    :param band: text below this fraction of the page height is left out
+    :return: the tokens of the content stream separated by spaces, without the strings of the footer
+    """
+    limit = band * page.rect.height
+    identity = (1, 0, 0, 1, 0, 0)
+    to_page = tuple(page.transformation_matrix)
+    ctm, tlm, stack = identity, identity, []
+    in_footer = None  # Whether the current text position is in the footer, None when it has to be computed again
+    tokens, operands = [], []
+    for token in CONTENT_TOKEN.findall(page.read_contents()):
+        if token[0] in OPERAND_START or token in (b'true', b'false', b'null'):
+            operands.append(token)
+            continue
+        try:
+            if token == b'q':
+                stack.append(ctm)
+            elif token == b'Q' and stack:
+                ctm, in_footer = stack.pop(), None
+            elif token == b'cm':
+                ctm, in_footer = multiply(tuple(map(float, operands[-6:])), ctm), None
+            elif token == b'BT':
+                tlm, in_footer = identity, None
+            elif token == b'Tm':
+                tlm, in_footer = tuple(map(float, operands[-6:])), None
+            elif token in (b'Td', b'TD'):
+                tx, ty = map(float, operands[-2:])
+                tlm, in_footer = multiply((1, 0, 0, 1, tx, ty), tlm), None
+            elif token in (b'Tj', b'TJ', b"'", b'"'):
+                if in_footer is None:
+                    in_footer = multiply(multiply(tlm, ctm), to_page)[5] >= limit
+                if in_footer:
+                    operands = []
+        except ValueError:
+            pass  # Malformed operands, the tokens are still hashed
+        tokens.extend(operands)
+        tokens.append(token)
+        operands = []
+    return b' '.join(tokens + operands)
+
+
+def page_fingerprint(page: fitz.Page) -> str:
+    """
+    Get a fingerprint of the content of a pdf page, which does not change between versions of a document unless the
+    page itself changes. The footer is left out since its document version and page numbers change in every version
+    :param page: a fitz page
+    :return: hash of the page content stream without footer, fonts and size
+    """
+    h = hashlib.sha1(mask_footer_text(page))
+    h.update(repr([font[1:] for font in page.get_fonts()]).encode())  # Without xref, renumbered between versions
+    h.update(repr(tuple(page.rect)).encode())
+    return h.hexdigest()
+
+
+def get_page_spans(page: fitz.Page) -> list:
+    """
+    Get the spans of text of a pdf page
+    :param page: a fitz page
+    :return rows: a list of tuples with bounding box, text, font information
+    """
+    blocks = page.get_text('dict')['blocks']  # Get the block information
     rows = [
         (
             xmin, ymin, xmax, ymax, text,
@@ -144,7 +265,6 @@ def get_scanned_pdf(path: str = "pdfs/download.pdf") -> pd.DataFrame:
             True if re.sub("[\(\[].*?[\)\]]", "", text).isupper() else False,
             span_font, font_size
         )
-        for page_num, blocks in block_dict.items()
         for block in blocks
         if block['type'] == 0
         for line in block['lines']
@@ -153,15 +273,158 @@ def get_scanned_pdf(path: str = "pdfs/download.pdf") -> pd.DataFrame:
         for xmin, ymin, xmax, ymax in [list(span['bbox'])]  # Get bounding box measurements
         for span_font, font_size in [(span['font'], span['size'])]
     ]
+    return rows
 
-    span_df = pd.DataFrame(rows, columns=['xmin', 'ymin', 'xmax', 'ymax',
-                                          'text', 'is_upper', 'is_bold',
-                                          'span_font', 'font_size'])
+
+def get_scanned_pdf(path: str = "pdfs/download.pdf",
+                    stream: bytes | None = None,
+                    cache: diskcache.Cache | None = None,
+                    expire: int = 30 * 86400) -> pd.DataFrame:
+    """
+    Obtain a pandas df containing bounding boxes of blocks of text, the original text and additional information
+    from a pdf file
+    :param path: path of the file, ignored if stream is given
+    :param stream: raw bytes of the pdf as returned by fetch_pdf. The buffer is handed to fitz as is, without copies
+    :param cache: if given, the spans of every page are cached by page fingerprint, so that only the pages that
+    changed in a new version of a document are extracted again
+    :param expire: seconds the cached pages are kept
+    :return span_df: a pandas dataframe
+    """
+    start = time.time()
+    if stream is not None:
+        doc = fitz.open(stream=stream, filetype='pdf')  # Open pdf from memory
+    else:
+        doc = fitz.open(path)  # Open pdf
+    end = time.time()
+    print('get_scanned_pdf: fitz.open: ', timedelta(seconds=end - start))
+
+    start = time.time()
+    rows = []
+    reused = 0
+    for page_num, page in enumerate(doc, start=1):  # Iterate all pages in the document
+        width, height = page.rect.width, page.rect.height
+        page_rows = None
+        if cache is not None:
+            key = f'page:{page_fingerprint(page)}'
+            page_rows = cache.get(key)
+        if page_rows is None:
+            page_rows = get_page_spans(page)
+            if cache is not None:
+                cache.set(key, page_rows, expire=expire)
+        else:
+            reused += 1
+        rows.extend((page_num, width, height, *row) for row in page_rows)
     end = time.time()
     print('get_scanned_pdf: Iterate over blocks and pages: ', timedelta(seconds=end - start))
+    print('get_scanned_pdf: pages reused from cache: ', reused, '/', len(doc))
+
+    span_df = pd.DataFrame(rows, columns=['page', 'page_width', 'page_height', 'xmin', 'ymin', 'xmax', 'ymax',
+                                          'text', 'is_upper', 'is_bold',
+                                          'span_font', 'font_size'])
     return span_df
 
 
+def count_overlaps(starts: np.ndarray, ends: np.ndarray, qstarts: np.ndarray, qends: np.ndarray) -> np.ndarray:
+    """
+    Counts the intervals overlapping every query interval, using the sorted interval bounds as index
+    :param starts: start of the indexed intervals
+    :param ends: end of the indexed intervals
+    :param qstarts: start of the query intervals
+    :param qends: end of the query intervals
+    :return: number of indexed intervals overlapping every query interval
+    """
+    # Intervals starting before the query ends, minus the ones which ended before the query starts
+    return np.searchsorted(np.sort(starts), qends, side='left') - np.searchsorted(np.sort(ends), qstarts, side='right')
+
+
+def find_gutter(page: pd.DataFrame, min_rows: int = 2, max_crossing: float = 0.2) -> float | None:
+    """
+    Finds the gap between the two columns of a page by sweeping the x extents of its spans. Among the gaps crossed by
+    few spans, the gutter is the one with the most lines holding text on both sides. Empty gaps inside a column,
+    like the one between a short "deleted" and the "Amendment" header, leave fewer lines on both sides
+    :param page: spans of a page, as obtained by get_scanned_pdf
+    :param min_rows: minimum number of spans of the right column sharing a line with spans of the left column
+    :param max_crossing: maximum fraction of spans crossing the gap, like full width text
+    :return: x position of the gap, or None if the page is not laid out in two columns
+    """
+    xmin, xmax = page['xmin'].to_numpy(), page['xmax'].to_numpy()
+    ymin, ymax = page['ymin'].to_numpy(), page['ymax'].to_numpy()
+    width = page['page_width'].iat[0]
+    lo, hi = 0.3 * width, 0.7 * width
+
+    # The gutter lies between the column headers when they are on the page
+    is_left_header = page['text'].isin(COLUMN_HEADERS).to_numpy()
+    is_right_header = (page['text'] == 'Amendment').to_numpy()
+    if is_left_header.any() and is_right_header.any():
+        same_line = count_overlaps(ymin[is_left_header], ymax[is_left_header],
+                                   ymin[is_right_header], ymax[is_right_header]) > 0
+        if same_line.any():
+            lo = xmax[is_left_header].max()
+            hi = xmin[is_right_header][same_line].min()
+
+    # Candidates are the midpoints between consecutive span edges in the middle of the page
+    edges = np.unique(np.concatenate([xmin, xmax, [lo, hi]]))
+    edges = edges[(edges >= lo) & (edges <= hi)]
+    if len(edges) < 2:
+        return None
+    candidates = (edges[:-1] + edges[1:]) / 2
+    crossing = count_overlaps(xmin, xmax, candidates, candidates)
+    keep = crossing <= max_crossing * len(page)
+
+    best, best_score = None, None
+    for gutter, crossed, gap in zip(candidates[keep], crossing[keep], np.diff(edges)[keep]):
+        # Number of spans of the right column sharing a line with the left column
+        left, right = xmax <= gutter, xmin >= gutter
+        shared = (count_overlaps(ymin[left], ymax[left], ymin[right], ymax[right]) > 0).sum()
+        score = (shared, -crossed, gap)
+        if best_score is None or score > best_score:
+            best, best_score = gutter, score
+    return float(best) if best is not None and best_score[0] >= min_rows else None
+
+
+def get_footer_cuts(df: pd.DataFrame, min_share: float = 0.5) -> pd.Series:
+    """
+    Finds the footer of every page as the text repeated at the bottom of the pages, page numbers aside
+    :param df: spans obtained by get_scanned_pdf
+    :param min_share: minimum fraction of the pages a text must appear on to be a footer
+    :return: y from which the footer starts on every page
+    """
+    pages = df.groupby('page')['page_height'].first()
+    bottom = df[df['ymin'] > FOOTER_BAND * df['page_height']]
+    keys = bottom['text'].str.replace(r'\d+', '#', regex=True)
+    counts = bottom.groupby(keys)['page'].nunique()
+    repeated = counts.index[counts >= max(2, min_share * len(pages))]
+    cuts = bottom[keys.isin(repeated)].groupby('page')['ymin'].min()
+    return cuts.reindex(pages.index).fillna(DEFAULT_FOOTER * pages)
+
+
+def label_regions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Labels the spans with the region of the page layout they belong to: footer, left or right column, or full width
+    text crossing both columns. The columns of every page are found from the geometry of its own spans; pages
+    without two columns, like pages only holding a justification, take the gutter of the previous page
+    :param df: spans obtained by get_scanned_pdf
+    :return df: df with the columns gutter and region
+    """
+    gutters = {}
+    for page, spans in df.groupby('page', sort=True):
+        gutter = find_gutter(spans)
+        if gutter is None:
+            # Fall back on the header of the text being amended
+            headers = spans.loc[spans['text'].isin(COLUMN_HEADERS), 'xmax']
+            gutter = headers.median() if len(headers) else np.NaN
+        gutters[page] = gutter
+    gutters = pd.Series(gutters, dtype=float).ffill().bfill()
+
+    df = df.assign(gutter=df['page'].map(gutters),
+                   footer=df['page'].map(get_footer_cuts(df)))
+    df['region'] = np.select([df['ymin'] >= df['footer'],
+                              df['xmax'] <= df['gutter'],
+                              df['xmin'] >= df['gutter']],
+                             ['footer', 'left', 'right'], 'full')
+    return df.drop(columns='footer')
+
+
 def clean_scanned(df: pd.DataFrame) -> pd.DataFrame:
     """
     Cleans the pandas df containing bounding boxes of blocks of text
@@ -170,7 +433,8 @@ def clean_scanned(df: pd.DataFrame) -> pd.DataFrame:
     """
 
     # Remove text at the bottom of the page
-    df = df[df['ymin'] <= 750]
+    df = label_regions(df)
+    df = df[df['region'] != 'footer']
     df = df[df['text'] != 'Or. en']
     # Create amendment number
     df['am_no'] = np.where(df.text.str.contains('Amendment [0-9]+', regex=True, na=False) == True, df['text'], np.NaN)
@@ -197,16 +461,13 @@ def clean_scanned(df: pd.DataFrame) -> pd.DataFrame:
     # Forward fill amendment number
     df['am_no'] = df['am_no'].ffill()
 
-    # Get max x of text proposed by the commission
-    df['xmax_comm'] = np.where((df['text'] == 'Text proposed by the Commission') |
-                               (df['text'] == 'Motion for a resolution') |
-                               (df['text'] == 'Draft opinion') |
-                               (df['text'] == 'Present text'), df['xmax'], np.NaN)
-    df['xmax_comm'] = df.groupby('am_no')['xmax_comm'].ffill()
-    # all text with xmin < xmax_comm is text proposed by the commission
-    df['type'] = np.where(df['xmin'] < df['xmax_comm'], 'Text proposed by the Commission', np.NaN)
-    # all text with xmin > xmax_comm is amendment text
-    df['type'] = np.where(df['xmin'] > df['xmax_comm'], 'Amendment', df['type'])
+    # The columns of an amendment start at the header of the text proposed by the commission
+    df['in_columns'] = np.where(df['text'].isin(COLUMN_HEADERS), True, np.NaN)
+    df['in_columns'] = df.groupby('am_no')['in_columns'].ffill() == True
+    # text starting in the left column is text proposed by the commission
+    df['type'] = np.where(df['in_columns'] & (df['xmin'] < df['gutter']), 'Text proposed by the Commission', np.NaN)
+    # text starting in the right column is amendment text
+    df['type'] = np.where(df['in_columns'] & (df['xmin'] >= df['gutter']), 'Amendment', df['type'])
 
     # Get article (the row below "Proposal for a regulation/directive/decision/resolution")
     # ((\bregulation\b)|(\bdirective\b)|(\bdecision\b)|(\bresolution\b))
@@ -230,44 +491,132 @@ def clean_scanned(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def find_differences(df: pd.DataFrame) -> pd.DataFrame:
+@functools.lru_cache(maxsize=None)
+def parse_article(article: str) -> tuple:
+    """
+    Splits an article reference in the levels of the hierarchy of the act
+    e.g. "Article 5 – paragraph 1 – point a – point ii" -> (('article', 'Article 5'), ('paragraph', 'paragraph 1'),
+    ('point', 'point a'), ('subpoint', 'point ii'))
+    :param article: article reference obtained by clean_scanned
+    :return: tuple of (level, name) pairs, from the broadest to the narrowest
+    """
+    levels = []
+    for part in re.split(r'\s+[–—-]\s+', article.strip()):
+        level = part.split(' ', 1)[0].lower()
+        if level not in ARTICLE_LEVELS:
+            level = 'other'
+        elif level == 'point' and levels and levels[-1][0] in ('point', 'subpoint'):
+            level = 'subpoint'
+        levels.append((level, part))
+    return tuple(levels)
+
+
+def build_article_index(df: pd.DataFrame) -> dict:
+    """
+    Builds a prefix tree of the article references (see parse_article). Every node holds the number of amendments
+    signed in it and in its sub-provisions, in total and by European Group, so that any level can be aggregated
+    without scanning the data again
+    :param df: df with Article and European Group columns, one row per MEP-amendment pair
+    :return index: nested dict with name, level, count, groups and children (dict of name: node)
+    """
+    def new_node(name, level):
+        return {'name': name, 'level': level, 'count': 0, 'groups': {}, 'children': {}}
+
+    def add(node, group, count):
+        node['count'] += count
+        if pd.isna(group) == False:
+            node['groups'][group] = node['groups'].get(group, 0) + count
+
+    index = new_node('All', 'root')
+    counts = df.groupby(['Article', 'European Group'], dropna=False).size()
+    for (article, group), count in counts.items():
+        if pd.isna(article):
+            continue
+        count = int(count)
+        node = index
+        add(node, group, count)
+        for level, name in parse_article(article):
+            node = node['children'].setdefault(name, new_node(name, level))
+            add(node, group, count)
+    return index
+
+
+def get_article_counts(index: dict, path: list | tuple = (), n: int = 20) -> pd.DataFrame:
+    """
+    Get the number of amendments by European Group of the most amended sub-provisions of a node of the article index
+    :param index: index obtained by build_article_index
+    :param path: names of the nodes from the root, empty for the top level (articles, recitals...)
+    :param n: number of sub-provisions to keep
+    :return: df with European Group, Article and Number of Amendments columns
+    """
+    node = index
+    for name in path:
+        node = node['children'][name]
+    children = sorted(node['children'].values(), key=lambda child: child['count'], reverse=True)[:n]
+    rows = [(group, child['name'], count) for child in children for group, count in child['groups'].items()]
+    return pd.DataFrame(rows, columns=['European Group', 'Article', 'Number of Amendments'])
+
+
+def diff_html(a: str, b: str) -> str:
+    """
+    Describes the differences between the text proposed by the commission and the amendment text as html
+    :param a: text proposed by the commission
+    :param b: amendment text
+    :return new_text: html with deleted text in red and inserted text in green
+    """
+    new_text = ""
+    m = difflib.SequenceMatcher(a=a, b=b)
+
+    for tag, i1, i2, j1, j2 in m.get_opcodes():
+        # good = #d9230f
+        # bad = #139418
+        if tag == 'replace':
+            # x = f'<del>{a[i1:i2]}</del>'
+            x = f"<span style ='color: #d9230f'>{a[i1:i2]}</span>"
+            new_text = new_text + x
+            # y = f'<ins>{b[j1:j2]}</ins>'
+            y = f"<span style ='color: #139418'>{b[j1:j2]}</span>"
+            new_text = new_text + y
+        if tag == 'delete':
+            # x = f'<del>{a[i1:i2]}</del>'
+            x = f"<span style ='color: #d9230f'>{a[i1:i2]}</span>"
+            new_text = new_text + x
+        if tag == 'insert':
+            # x = f'<ins>{b[j1:j2]}</ins>'
+            x = f"<span style ='color: #139418'>{b[j1:j2]}</span>"
+            new_text = new_text + x
+        if tag == 'equal':
+            # x = f'{a[i1:i2]}'
+            x = f"<span style ='color: black'>{a[i1:i2]}</span>"
+            new_text = new_text + x
+    return new_text
+
+
+def find_differences(df: pd.DataFrame,
+                     cache: diskcache.Cache | None = None,
+                     expire: int = 30 * 86400) -> pd.DataFrame:
     """
     Create a new column in df which describes the differences between the text proposed by the commission and the
     amendment text
     :param df: pandas dataframe obtained through clean_df
+    :param cache: if given, differences are cached by content, so that only new or modified amendments are compared
+    :param expire: seconds the cached differences are kept
     :return:
     """
+    diffs = {}
     for index, row in df.iterrows():
         b = row['Amendment']
         a = row['Text proposed by the Commission']
-        new_text = ""
         if pd.isnull(a) == False:
             if pd.isnull(b) == False:
-                m = difflib.SequenceMatcher(a=a, b=b)
-
-                for tag, i1, i2, j1, j2 in m.get_opcodes():
-                    # good = #d9230f
-                    # bad = #139418
-                    if tag == 'replace':
-                        # x = f'<del>{a[i1:i2]}</del>'
-                        x = f"<span style ='color: #d9230f'>{a[i1:i2]}</span>"
-                        new_text = new_text + x
-                        # y = f'<ins>{b[j1:j2]}</ins>'
-                        y = f"<span style ='color: #139418'>{b[j1:j2]}</span>"
-                        new_text = new_text + y
-                    if tag == 'delete':
-                        # x = f'<del>{a[i1:i2]}</del>'
-                        x = f"<span style ='color: #d9230f'>{a[i1:i2]}</span>"
-                        new_text = new_text + x
-                    if tag == 'insert':
-                        # x = f'<ins>{b[j1:j2]}</ins>'
-                        x = f"<span style ='color: #139418'>{b[j1:j2]}</span>"
-                        new_text = new_text + x
-                    if tag == 'equal':
-                        # x = f'{a[i1:i2]}'
-                        x = f"<span style ='color: black'>{a[i1:i2]}</span>"
-                        new_text = new_text + x
-                df.loc[index, 'Modified Text'] = new_text
+                key = hashlib.sha1(f'{a}\x00{b}'.encode()).hexdigest()
+                if key not in diffs:
+                    diffs[key] = cache.get(f'diff:{key}') if cache is not None else None
+                    if diffs[key] is None:
+                        diffs[key] = diff_html(a=a, b=b)
+                        if cache is not None:
+                            cache.set(f'diff:{key}', diffs[key], expire=expire)
+                df.loc[index, 'Modified Text'] = diffs[key]
     return df
 
 
@@ -278,9 +627,7 @@ def get_mep_amendment(df: pd.DataFrame) -> pd.DataFrame:
     :return df: df containing mep name and amendment number
     """
     # Get MEP-Amendment correspondence
-    subdf = df[['meps', 'am_no']].copy()
-    subdf = subdf.dropna()
-    subdf['meps'] = subdf['meps'].str.replace('on behalf of the ', '', regex=False)
+    subdf = df[['meps', 'am_no']].dropna()
     subdf = subdf.assign(meps=df['meps'].str.split(', ')).explode('meps')
     return subdf
 
@@ -292,8 +639,7 @@ def get_article_amendment(df: pd.DataFrame) -> pd.DataFrame:
     :return df: df containing article and amendment number
     """
     # Get MEP-Amendment correspondence
-    subdf = df[['article', 'am_no']].copy()
-    subdf = subdf.dropna()
+    subdf = df[['article', 'am_no']].dropna()
     return subdf
 
 
@@ -304,8 +650,7 @@ def get_justification_amendment(df: pd.DataFrame) -> pd.DataFrame:
     :return df: df containing justification and amendment number
     """
     # Get MEP-Amendment correspondence
-    subdf = df[['justification', 'am_no']].copy()
-    subdf = subdf.dropna()
+    subdf = df[['justification', 'am_no']].dropna()
     subdf = subdf.groupby('am_no', as_index=False).agg({'justification': ' '.join})
     return subdf
 
@@ -317,9 +662,7 @@ def get_text_by_type(df: pd.DataFrame) -> pd.DataFrame:
     :return df: df containing justification and amendment number
     """
     # Get MEP-Amendment correspondence
-    subdf = df[['text', 'am_no', 'type']].copy()
-    subdf = subdf.dropna()
-    subdf = subdf[subdf['type'].isna() == False]
+    subdf = df[['text', 'am_no', 'type']].dropna()
     subdf = subdf.groupby(['am_no', 'type'], as_index=False).agg({'text': ' '.join})
     subdf = subdf.pivot(index='am_no', columns='type', values='text')
     return subdf
@@ -349,6 +692,8 @@ def join_dfs(df: pd.DataFrame) -> pd.DataFrame:
     df_total['Amendment'] = df_total['Amendment'].str.removesuffix('Justification')
     df_total['Amendment'] = df_total['Amendment'].str.removeprefix('Amendment')
     df_total['Amendment'] = df_total['Amendment'].str.removeprefix('Draft opinion')
+    df_total['Text proposed by the Commission'] = df_total['Text proposed by the Commission'].str.removesuffix(
+        'Justification')
     df_total['Text proposed by the Commission'] = df_total['Text proposed by the Commission'].str.removeprefix(
         'Text proposed by the Commission')
     df_total['Text proposed by the Commission'] = df_total['Text proposed by the Commission'].str.removeprefix(
@@ -359,6 +704,388 @@ def join_dfs(df: pd.DataFrame) -> pd.DataFrame:
     return df_total
 
 
+def get_shingles(text: str, k: int = 3) -> np.ndarray:
+    """
+    Get the hashed word k-grams of a text
+    :param text: the text
+    :param k: number of words in every shingle
+    :return: array of unique shingle hashes, empty if the text is missing or shorter than k words
+    """
+    words = re.findall(r'\w+', text.lower()) if isinstance(text, str) else []
+    grams = [' '.join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.unique(np.array([zlib.crc32(g.encode()) for g in grams], dtype=np.uint64))
+
+
+def minhash_signatures(texts, num_perm: int = 128, seed: int = 1) -> np.ndarray:
+    """
+    Get the MinHash signature of every text. The fraction of equal values in two signatures estimates the Jaccard
+    similarity of the shingles of the two texts
+    :param texts: iterable of texts
+    :param num_perm: number of hash functions, the length of every signature
+    :param seed: seed of the hash functions, signatures are only comparable if computed with the same seed
+    :return signatures: array of shape (number of texts, num_perm). Texts without shingles have all values equal to
+    MINHASH_PRIME
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    texts = list(texts)
+    signatures = np.full((len(texts), num_perm), MINHASH_PRIME, dtype=np.uint64)
+    for i, text in enumerate(texts):
+        shingles = get_shingles(text)
+        if len(shingles):
+            signatures[i] = ((np.outer(shingles, a) + b) % MINHASH_PRIME).min(axis=0)
+    return signatures
+
+
+def lsh_candidates(signatures: np.ndarray, bands: int = 16, max_bucket: int = 50) -> set:
+    """
+    Get candidate pairs of similar signatures through locality sensitive hashing: signatures are split in bands and
+    two signatures are candidates if they are equal in at least one band
+    :param signatures: array obtained by minhash_signatures
+    :param bands: number of bands, more bands find pairs with lower similarity
+    :param max_bucket: buckets with more signatures are skipped, so that boilerplate texts shared by many
+    amendments do not make the number of pairs grow quadratically
+    :return pairs: set of (i, j) row indices with i < j
+    """
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for members in buckets.values():
+            if 1 < len(members) <= max_bucket:
+                pairs.update(itertools.combinations(members, 2))
+    return pairs
+
+
+def find_duplicate_clusters(signatures: np.ndarray, threshold: float = 0.8, bands: int = 16) -> np.ndarray:
+    """
+    Groups near-duplicate signatures in clusters
+    :param signatures: array obtained by minhash_signatures
+    :param threshold: minimum estimated Jaccard similarity of two duplicates
+    :param bands: number of LSH bands, see lsh_candidates
+    :return labels: the cluster of every signature, -1 if it has no duplicates
+    """
+    parent = np.arange(len(signatures))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in lsh_candidates(signatures, bands=bands):
+        if np.mean(signatures[i] == signatures[j]) >= threshold:
+            parent[find(i)] = find(j)
+
+    roots = np.array([find(i) for i in range(len(signatures))], dtype=int)
+    sizes = np.bincount(roots, minlength=len(signatures))
+    return np.where(sizes[roots] > 1, roots, -1)
+
+
+def add_duplicates(df_total: pd.DataFrame,
+                   threshold: float = 0.8,
+                   num_perm: int = 128,
+                   bands: int = 16,
+                   cache: diskcache.Cache | None = None,
+                   doc_key: str | None = None,
+                   label: str | None = None) -> pd.DataFrame:
+    """
+    Finds near-duplicate amendments with MinHash and LSH. Amendments are compared together with the text they amend,
+    so that amendments deleting different provisions are not duplicates because they all read "deleted". Adds a
+    column with the cluster of duplicates of every amendment (-1 if none) and a column listing its duplicates. If a
+    cache and doc_key are given, the amendments are also compared with the other documents stored in the cache and
+    the signatures of the document are stored.
+    :param df_total: df obtained by join_dfs, with columns called Amendment and Text proposed by the Commission
+    :param threshold: minimum estimated Jaccard similarity of two duplicates
+    :param num_perm: length of the MinHash signatures
+    :param bands: number of LSH bands
+    :param cache: cache in which the signatures of the corpus are stored
+    :param doc_key: key identifying the document in the corpus
+    :param label: readable name of the document, used to refer to its amendments from other documents
+    :return:
+    """
+    amendments = df_total.drop_duplicates('Amendment Number')
+    am_nos = amendments['Amendment Number'].to_numpy()
+    texts = amendments['Text proposed by the Commission'].fillna('') + ' ' + amendments['Amendment'].fillna('')
+    signatures = minhash_signatures(texts, num_perm=num_perm)
+    valid = (signatures != MINHASH_PRIME).any(axis=1)
+
+    labels = np.full(len(am_nos), -1)
+    labels[valid] = find_duplicate_clusters(signatures[valid], threshold=threshold, bands=bands)
+    clusters = pd.DataFrame({'Amendment Number': am_nos, 'Duplicate Cluster': labels})
+    members = clusters[clusters['Duplicate Cluster'] >= 0].groupby('Duplicate Cluster')['Amendment Number'].agg(list)
+    clusters['Duplicates'] = [', '.join(m for m in members[c] if m != am) if c >= 0 else ''
+                              for am, c in zip(am_nos, labels)]
+    df_total = df_total.merge(clusters, how='left', on='Amendment Number')
+
+    if cache is not None and doc_key is not None:
+        am_nos, signatures = am_nos[valid], signatures[valid]
+
+        # Compare with the rest of the corpus
+        stacked = [signatures]
+        owners = [(label, am) for am in am_nos]
+        for other in cache.get('minhash:documents', []):
+            stored = cache.get(f'minhash:{other}')
+            if other == doc_key or stored is None or stored['signatures'].shape[1] != num_perm:
+                continue
+            stacked.append(stored['signatures'])
+            owners.extend((stored['label'], am) for am in stored['am_no'])
+        corpus = np.vstack(stacked)
+
+        matches = {}
+        for i, j in lsh_candidates(corpus, bands=bands):
+            # Only pairs between this document (the first rows) and the rest of the corpus
+            if i < len(am_nos) <= j and np.mean(corpus[i] == corpus[j]) >= threshold:
+                matches.setdefault(am_nos[i], []).append(f'{owners[j][0]} #{owners[j][1]}')
+        df_total['Similar in other documents'] = df_total['Amendment Number'].map(
+            lambda am: '; '.join(matches.get(am, [])))
+
+        # Store the signatures of this document
+        cache.set(f'minhash:{doc_key}', {'label': label, 'am_no': list(am_nos), 'signatures': signatures})
+        with cache.transact():
+            documents = cache.get('minhash:documents', [])
+            if doc_key not in documents:
+                cache.set('minhash:documents', documents + [doc_key])
+
+    return df_total
+
+
+def normalize_amendments(df_total: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Splits the df obtained by add_scraped_info, which has one row for every MEP-amendment pair, in three tables
+    without repeated values
+    :param df_total: df with MEP and Amendment Number columns
+    :return: amendments (one row per amendment), meps (one row per MEP) and links (the position in amendments and
+    meps of every row of df_total)
+    """
+    df_total = df_total.dropna(subset=['MEP', 'Amendment Number'])
+    mep_cols = ['MEP'] + [col for col in MEP_COLUMNS if col in df_total.columns]
+    meps = df_total.drop_duplicates('MEP')[mep_cols].reset_index(drop=True)
+    amendments = df_total.drop_duplicates('Amendment Number').drop(mep_cols, axis=1).reset_index(drop=True)
+    links = pd.DataFrame({
+        'amendment': pd.Categorical(df_total['Amendment Number'], categories=amendments['Amendment Number']).codes,
+        'mep': pd.Categorical(df_total['MEP'], categories=meps['MEP']).codes})
+    return amendments, meps, links
+
+
+def denormalize_amendments(amendments: pd.DataFrame, meps: pd.DataFrame, links: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inverse of normalize_amendments
+    :param amendments: one row per amendment
+    :param meps: one row per MEP
+    :param links: position in amendments and meps of every MEP-amendment pair
+    :return: df with one row for every row of links
+    """
+    return pd.concat([meps.iloc[links['mep']].reset_index(drop=True),
+                      amendments.iloc[links['amendment']].reset_index(drop=True)], axis=1)
+
+
+def to_columns(df: pd.DataFrame) -> dict:
+    """
+    Transforms a df into a json serializable dict of columns, with missing values as None
+    :param df: a pandas dataframe
+    :return: dict of column name: list of values
+    """
+    return {col: df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns}
+
+
+def get_data_store(amendments: pd.DataFrame,
+                   meps: pd.DataFrame,
+                   links: pd.DataFrame,
+                   color_discrete_map: dict,
+                   article_index: dict,
+                   bar_top_n: int = 50) -> dict:
+    """
+    Get the data used by the clientside callbacks in assets/crossfilter.js in a compact, column oriented format
+    :param amendments: amendments obtained by normalize_amendments
+    :param meps: meps obtained by normalize_amendments
+    :param links: links obtained by normalize_amendments
+    :param color_discrete_map: color of every European Group
+    :param article_index: index obtained by build_article_index
+    :param bar_top_n: number of MEPs shown in the bar chart
+    :return: dict with amendments, meps, links, colors, the article index, the path of every amendment in it and
+    the bar chart settings
+    """
+    article_paths = [[name for _, name in parse_article(article)] if isinstance(article, str) else []
+                     for article in amendments['Article']]
+    return {'amendments': to_columns(amendments),
+            'meps': to_columns(meps.drop(['picture_link', 'thumbnail'], axis=1, errors='ignore')),
+            'links': to_columns(links),
+            'colors': color_discrete_map,
+            'article_index': article_index,
+            'article_paths': article_paths,
+            'bar': {'top_n': bar_top_n, 'others_color': OTHERS_COLOR}}
+
+
+def get_polar_figure(df_polar: pd.DataFrame, color_discrete_map: dict) -> go.Figure:
+    """
+    Get the polar chart of the most amended articles, with one trace per European Group
+    :param df_polar: df obtained by get_article_counts
+    :param color_discrete_map: color of every European Group
+    :return: the figure
+    """
+    traces = [go.Barpolar(r=group_df['Number of Amendments'], theta=group_df['Article'], name=group,
+                          marker_color=color_discrete_map.get(group))
+              for group, group_df in df_polar.groupby('European Group', sort=False)]
+    fig = go.Figure(traces)
+    fig.update_layout(template=FIGURE_TEMPLATE, title='Top 20 most amended articles', font_family='sans-serif',
+                      plot_bgcolor='#fcfcfc', paper_bgcolor='#fcfcfc', showlegend=False)
+    return fig
+
+
+def get_bar_figure(df_total: pd.DataFrame, color_discrete_map: dict, top_n: int = 50) -> go.Figure:
+    """
+    Get the bar chart of the MEPs who signed the most amendments, with one trace per European Group. The MEPs
+    outside of the top are aggregated in a single bar, so that the chart does not get a category per MEP
+    :param df_total: df obtained by add_scraped_info
+    :param color_discrete_map: color of every European Group
+    :param top_n: number of MEPs shown
+    :return: the figure
+    """
+    counts = df_total['MEP'].value_counts()
+    groups = df_total.drop_duplicates('MEP').set_index('MEP')['European Group']
+    top, others = counts.iloc[:top_n], counts.iloc[top_n:]
+
+    top_groups = groups.reindex(top.index).fillna('Unknown')
+    traces = [go.Bar(x=group_counts, y=group_counts.index, name=group, orientation='h',
+                     marker_color=color_discrete_map.get(group))
+              for group, group_counts in top.groupby(top_groups, sort=False)]
+    categories = top.index[::-1].tolist()
+    if len(others):
+        label = f'Others ({len(others)} MEPs)'
+        traces.append(go.Bar(x=[others.sum()], y=[label], name='Others', orientation='h',
+                             marker_color=OTHERS_COLOR))
+        categories.insert(0, label)
+
+    fig = go.Figure(traces)
+    fig.update_layout(template=FIGURE_TEMPLATE, title='Who signed the most amendments?', font_family='sans-serif',
+                      plot_bgcolor='#fcfcfc', paper_bgcolor='#fcfcfc', showlegend=False,
+                      xaxis_title='Number of amendments',
+                      yaxis={'categoryorder': 'array', 'categoryarray': categories})
+    return fig
+
+
+def cached_figure(key: str, build, cache: diskcache.Cache | None = None, expire: int = 86400) -> dict:
+    """
+    Get a figure serialized by plotly, built only if it is not in the cache yet
+    :param key: cache key, like figure:{document key}:{result version}:{figure name}:{parameters}
+    :param build: function returning the go.Figure
+    :param cache: if given, the serialized figure is kept there and shared by all the processes and users
+    :param expire: seconds the figure is kept
+    :return: the figure as a dict, ready for dcc.Graph
+    """
+    if cache is not None:
+        figure = cache.get(key)
+        if figure is not None:
+            return figure
+    figure = json.loads(build().to_json())
+    if cache is not None:
+        cache.set(key, figure, expire=expire)
+    return figure
+
+
+def iter_export_chunks(amendments: pd.DataFrame,
+                       meps: pd.DataFrame,
+                       links: pd.DataFrame,
+                       table: str = 'denormalized',
+                       columns: list | None = None,
+                       chunk_size: int = 5000):
+    """
+    Yields a table of a processed document in chunks, so that the denormalized table is never held in memory at once
+    :param amendments: amendments obtained by normalize_amendments
+    :param meps: meps obtained by normalize_amendments
+    :param links: links obtained by normalize_amendments
+    :param table: 'denormalized' for one row per MEP-amendment pair, 'amendments', 'meps' or 'links' (Amendment
+    Number and MEP of every pair)
+    :param columns: columns to keep, all if None
+    :param chunk_size: number of rows in every chunk
+    :return: generator of pandas dataframes
+    """
+    def get_links(rows):
+        return pd.DataFrame({'Amendment Number': amendments['Amendment Number'].to_numpy()[links['amendment'][rows]],
+                             'MEP': meps['MEP'].to_numpy()[links['mep'][rows]]})
+
+    sources = {'denormalized': (lambda rows: denormalize_amendments(amendments, meps, links.iloc[rows]), len(links)),
+               'amendments': (lambda rows: amendments.iloc[rows], len(amendments)),
+               'meps': (lambda rows: meps.iloc[rows], len(meps)),
+               'links': (get_links, len(links))}
+    get_rows, n_rows = sources[table]
+
+    for start in range(0, n_rows, chunk_size):
+        chunk = get_rows(slice(start, start + chunk_size))
+        if columns is not None:
+            chunk = chunk[[col for col in columns if col in chunk.columns]]
+        yield chunk
+
+
+def stream_csv(chunks):
+    """
+    Writes chunks of a table as csv
+    :param chunks: generator obtained by iter_export_chunks
+    :return: generator of csv strings
+    """
+    for i, chunk in enumerate(chunks):
+        yield chunk.to_csv(index=False, header=i == 0)
+
+
+def write_xlsx(chunks, path: str):
+    """
+    Writes chunks of a table in an xlsx file. The workbook is in write only mode, so rows are not kept in memory
+    :param chunks: generator obtained by iter_export_chunks
+    :param path: path of the file
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            ws.append(list(chunk.columns))
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False):
+            ws.append([ILLEGAL_CHARACTERS_RE.sub('', v) if isinstance(v, str) else v for v in row])
+    wb.save(path)
+
+
+def write_parquet(chunks, path: str):
+    """
+    Writes chunks of a table in a parquet file, one row group per chunk
+    :param chunks: generator obtained by iter_export_chunks
+    :param path: path of the file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            # Text columns as strings, so that the schema does not depend on missing values in the chunk
+            chunk = chunk.astype({col: 'string' for col in chunk.columns if chunk[col].dtype == object})
+            arrow_table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, arrow_table.schema)
+            writer.write_table(arrow_table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def stream_file(path: str, block_size: int = 1 << 16):
+    """
+    Reads a file in blocks
+    :param path: path of the file
+    :param block_size: size of every block in bytes
+    :return: generator of bytes
+    """
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            yield block
+
+
 def get_network_elements(df: pd.DataFrame) -> list:
     """
     Transforms the df obtained by join_dfs into the elements of a network graph
@@ -369,7 +1096,7 @@ def get_network_elements(df: pd.DataFrame) -> list:
     # Create a df containing the combinations of MEPs
     edges_df = pd.DataFrame()
     for amendment in df['Amendment Number'].unique():
-        filter_df = df[df['Amendment Number'] == amendment].copy()
+        filter_df = df[df['Amendment Number'] == amendment]
         for mep in filter_df['MEP'].unique():
             meplist = filter_df[filter_df['MEP'] != mep][['MEP']]
             meplist = meplist.rename(columns={'MEP': 'node2'})
@@ -413,7 +1140,7 @@ def get_network_elements_v2(df: pd.DataFrame) -> list:
     # Create a df containing the combinations of MEPs
     edges_df = pd.DataFrame()
     for amendment in df['Amendment Number'].unique():
-        filter_df = df[df['Amendment Number'] == amendment].copy()
+        filter_df = df[df['Amendment Number'] == amendment]
         for mep in filter_df['MEP'].unique():
             meplist = filter_df[filter_df['MEP'] != mep][['MEP']]
             meplist = meplist.rename(columns={'MEP': 'node2'})
@@ -423,13 +1150,25 @@ def get_network_elements_v2(df: pd.DataFrame) -> list:
 
     # Obtain count of combinations
     edges_df = edges_df.groupby(['node1', 'node2']).size().reset_index().rename(columns={0: 'count'})
+
+    # MEPs who tabled different amendments of the same cluster of duplicates (see add_duplicates)
+    dup_df = pd.DataFrame(columns=['node1', 'node2', 'count'])
+    if 'Duplicate Cluster' in df.columns:
+        dup_df = df.loc[df['Duplicate Cluster'] >= 0, ['Duplicate Cluster', 'Amendment Number', 'MEP']]
+        dup_df = dup_df.drop_duplicates()
+        dup_df = dup_df.merge(dup_df, on='Duplicate Cluster')
+        dup_df = dup_df[(dup_df['Amendment Number_x'] != dup_df['Amendment Number_y']) &
+                        (dup_df['MEP_x'] != dup_df['MEP_y'])]
+        dup_df = dup_df.groupby(['MEP_x', 'MEP_y']).size().reset_index(name='count')
+        dup_df = dup_df.rename(columns={'MEP_x': 'node1', 'MEP_y': 'node2'})
+
     # Get a dictionary of ids for every mep
-    id_dict = dict(enumerate(edges_df.node1.unique()))
+    id_dict = dict(enumerate(pd.concat([edges_df.node1, dup_df.node1]).unique()))
     id_dict = {y: x for x, y in id_dict.items()}
 
     # Obtain nodes
     elements = []
-    for mep in edges_df['node1'].unique():
+    for mep in id_dict:
         mep_id = id_dict[mep]
         # img_url = df[df['MEP']==mep]['picture_link'].iloc[0]
         d = {'classes': 'nopic', 'data': {'id': mep_id, 'label': mep}, 'position': {'x': 75, 'y': 75}}
@@ -444,50 +1183,136 @@ def get_network_elements_v2(df: pd.DataFrame) -> list:
         d = {'data': {'source': node1_id, 'target': node2_id, 'weight': weight}}
         elements.append(d)
 
+    for index, row in dup_df.iterrows():
+        d = {'classes': 'duplicate',
+             'data': {'source': id_dict[row['node1']], 'target': id_dict[row['node2']], 'weight': row['count']}}
+        elements.append(d)
+
     return elements
 
 
+def make_thumbnail(picture_link: str, folder: str, size: Tuple[int, int] = (256, 320)) -> str:
+    """
+    Downloads a picture and saves a resized copy in webp format
+    :param picture_link: url of the picture
+    :param folder: folder of the thumbnails
+    :param size: maximum width and height of the thumbnail
+    :return name: file name of the thumbnail, a hash of its content so that it can be cached by browsers forever
+    """
+    response = requests.get(picture_link, timeout=30)
+    response.raise_for_status()
+    img = Image.open(BytesIO(response.content))
+    img.thumbnail(size)
+    with BytesIO() as buffer:
+        img.convert('RGB').save(buffer, 'webp', quality=80)
+        content = buffer.getvalue()
+    name = f'{hashlib.sha1(content).hexdigest()[:16]}.webp'
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        with open(path, 'wb') as img_file:
+            img_file.write(content)
+    return name
+
+
+def cache_thumbnails(picture_links: list,
+                     folder: str,
+                     size: Tuple[int, int] = (256, 320),
+                     max_workers: int = 8) -> dict:
+    """
+    Saves thumbnails of many pictures concurrently, see make_thumbnail
+    :param picture_links: urls of the pictures
+    :param folder: folder of the thumbnails
+    :param size: maximum width and height of the thumbnails
+    :param max_workers: number of pictures downloaded at the same time
+    :return: dict of picture link: file name of the thumbnail. Pictures that could not be downloaded are missing
+    """
+    def get_thumbnail(picture_link):
+        try:
+            return make_thumbnail(picture_link, folder=folder, size=size)
+        except Exception as e:
+            print('cache_thumbnails: ', picture_link, e)
+            return None
+
+    picture_links = list(dict.fromkeys(picture_links))
+    os.makedirs(folder, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        names = executor.map(get_thumbnail, picture_links)
+    return {link: name for link, name in zip(picture_links, names) if name is not None}
+
+
 def scrape_info(df: pd.DataFrame,
-                url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all') -> pd.DataFrame:
+                url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all',
+                cache: diskcache.Cache | None = None,
+                expire: int = 86400,
+                thumbnail_folder: str | None = None) -> pd.DataFrame:
     """
     Scrapes information about mep nationality, picture and party from url
     :param df: df obtained by clean_df
     :param url: mep directory url
+    :param cache: if given, the information about every mep is cached, so that only new meps are scraped
+    :param expire: seconds the cached information is kept before it is scraped again
+    :param thumbnail_folder: if given, thumbnails of the pictures of the scraped meps are saved in this folder (see
+    cache_thumbnails) and their file name is added in a thumbnail column
     :return:
     """
-    webpage = requests.get(url)
-    html = webpage.text
-    soup = BeautifulSoup(html, features="html.parser")
-
     total_data = []
-
+    missing = []
     for mep in df['MEP'].unique():
+        dicti = cache.get(f'mep:{mep}') if cache is not None else None
+        if dicti is None:
+            missing.append(mep)
+        elif dicti:
+            total_data.append(dicti)
+
+    if missing:
+        webpage = requests.get(url)
+        html = webpage.text
+        soup = BeautifulSoup(html, features="html.parser")
+
+    scraped = {}
+    for mep in missing:
         dicti = {"MEP": mep}
 
         img = soup.find("img", {"alt": re.compile(f"{mep}", re.I)})
-        if img:
-            x = img.parent.parent.parent.parent
-            if x:
-                href = x['href']
-                webpage2 = requests.get(href)
-                soup2 = BeautifulSoup(webpage2.text, features="html.parser")
-
-                span = soup2.find("span", {"class": 'erpl_newshub-photomep'})
-                img = span.find("img") if span else None
-
-                dicti["picture_link"] = img['src'] if img else np.NaN
-
-                div = soup2.find_all('div', {"class": 'col-12'})
-                for div_item in div:
-                    pol_group = div_item.find('h3')
-                    home_group = div_item.find('div', {"class": 'erpl_title-h3 mt-1 mb-1'})
-
-                    if pol_group:
-                        dicti["European Group"] = pol_group.text.strip()
-                    if home_group:
-                        dicti["national"] = home_group.text.strip()
-
-                total_data.append(dicti)
+        x = img.parent.parent.parent.parent if img else None
+        if x:
+            href = x['href']
+            webpage2 = requests.get(href)
+            soup2 = BeautifulSoup(webpage2.text, features="html.parser")
+
+            span = soup2.find("span", {"class": 'erpl_newshub-photomep'})
+            img = span.find("img") if span else None
+
+            dicti["picture_link"] = img['src'] if img else np.NaN
+
+            div = soup2.find_all('div', {"class": 'col-12'})
+            for div_item in div:
+                pol_group = div_item.find('h3')
+                home_group = div_item.find('div', {"class": 'erpl_title-h3 mt-1 mb-1'})
+
+                if pol_group:
+                    dicti["European Group"] = pol_group.text.strip()
+                if home_group:
+                    dicti["national"] = home_group.text.strip()
+
+            total_data.append(dicti)
+        else:
+            dicti = {}  # Not in the directory, remember it so that it is not searched again
+        scraped[mep] = dicti
+
+    if thumbnail_folder is not None:
+        # Pictures of the meps just scraped, and of those whose thumbnail is no longer on disk
+        stale = [dicti for dicti in total_data if isinstance(dicti.get('picture_link'), str) and
+                 (dicti['MEP'] in scraped or
+                  not os.path.exists(os.path.join(thumbnail_folder, str(dicti.get('thumbnail')))))]
+        thumbnails = cache_thumbnails([dicti['picture_link'] for dicti in stale], folder=thumbnail_folder)
+        for dicti in stale:
+            dicti['thumbnail'] = thumbnails.get(dicti['picture_link'], np.NaN)
+            scraped[dicti['MEP']] = dicti
+
+    if cache is not None:
+        for mep, dicti in scraped.items():
+            cache.set(f'mep:{mep}', dicti, expire=expire)
 
     total_df = pd.DataFrame(total_data)
     total_df['Country'] = total_df['national'].str.extract(r'\((.*?)\)', expand=True)
@@ -497,20 +1322,24 @@ def scrape_info(df: pd.DataFrame,
 
 
 def add_scraped_info(df: pd.DataFrame,
-                     url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all') -> pd.DataFrame:
+                     url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all',
+                     cache: diskcache.Cache | None = None,
+                     thumbnail_folder: str | None = None) -> pd.DataFrame:
     """
     Adds new column containing differences in original and amended text. Joins df and scraped info.
     :param df: df obtained through clean_df
     :param url: mep directory url
+    :param cache: if given, differences and scraped info are cached, see find_differences and scrape_info
+    :param thumbnail_folder: if given, thumbnails of the mep pictures are saved in this folder, see scrape_info
     :return:
     """
     start = time.time()
-    df = find_differences(df=df)
+    df = find_differences(df=df, cache=cache)
     end = time.time()
     print('add_scraped_info: find_differences: ', timedelta(seconds=end - start))
 
     start = time.time()
-    scraped_df = scrape_info(df=df, url=url)
+    scraped_df = scrape_info(df=df, url=url, cache=cache, thumbnail_folder=thumbnail_folder)
     end = time.time()
     print('add_scraped_info: scrape_info: ', timedelta(seconds=end - start))
 
@@ -523,15 +1352,17 @@ def add_scraped_info(df: pd.DataFrame,
 
 
 def add_scraped_info_no_diff(df: pd.DataFrame,
-                             url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all') -> pd.DataFrame:
+                             url: str = 'https://www.europarl.europa.eu/meps/en/directory/all/all',
+                             cache: diskcache.Cache | None = None) -> pd.DataFrame:
     """
     Joins df and scraped info.
     :param url:
     :param df: df obtained through clean_df
+    :param cache: if given, scraped info is cached, see scrape_info
     :return:
     """
     start = time.time()
-    scraped_df = scrape_info(df=df, url=url)
+    scraped_df = scrape_info(df=df, url=url, cache=cache)
     end = time.time()
     print('add_scraped_info_no_diff: scrape_info: ', timedelta(seconds=end - start))
 